@@ -1,42 +1,173 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, url_for
 from werkzeug.utils import secure_filename
 from smartworkers.pdf_smartworker import PdfSmartWorker
+from smartworkers.backends import OpenAIBackend
+from smartworkers.cache import ResponseCache
+from smartworkers.executor import CodeExecutor
+from smartworkers.jobs import FINISHED, DONE, JobQueue, JobStore, QueueFull
+from smartworkers.contract import ContractError, compile_contract
+from smartworkers.tracing import Tracer
+import json
 import os
+import shutil
+import uuid
 import logging
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = '/path/to/upload/directory'  # set this to your desired path
 app.config['ALLOWED_EXTENSIONS'] = {'pdf'}
+app.config['JOB_DATABASE'] = 'jobs.sqlite'  # persistent job store
+app.config['JOB_WORKERS'] = 2  # PDFs processed at the same time
+app.config['JOB_QUEUE_SIZE'] = 16  # waiting jobs before new uploads are rejected
+app.config['UPLOAD_CHUNK_SIZE'] = 1024 * 1024
+app.config['PDF_CACHE'] = 'pdf_cache.sqlite'  # page texts and chunk results reused across uploads
+app.config['TRACE_FILE'] = 'trace.jsonl'  # one JSON span per line, None keeps only the /metrics aggregates
+
+# Spans of every job, aggregated for /metrics and appended to the trace file
+tracer = Tracer(app.config['TRACE_FILE'])
+
+# Shared by every job: one connection pool, one cache connection and one code executor for the process
+backend = OpenAIBackend(os.getenv("OPENAI_API_KEY"))
+pdf_cache = ResponseCache(app.config['PDF_CACHE'], max_entries=4096)
+code_executor = CodeExecutor()
 
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
+def process_pdf_job(filepath, params, progress):
+    # Runs on a job worker thread, outside of any request
+    smart_worker = PdfSmartWorker(params.get("contract", {}), backend=backend, chunk_cache=pdf_cache,
+                                  code_executor=code_executor, tracer=tracer)
+    return smart_worker.process_pdf(filepath, progress)
+
+# Never started on import: the spawned page extraction processes import this file as well.
+# create_app() or the __main__ block below start it in the process serving the requests
+job_queue = JobQueue(JobStore(app.config['JOB_DATABASE']), process_pdf_job,
+                     app.config['JOB_WORKERS'], app.config['JOB_QUEUE_SIZE'])
+
+def job_status(job):
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "message": job["message"],
+        "error": job["error"],
+    }
+
 @app.route('/process_pdf', methods=['POST'])
 def process_pdf():
-    # Check if a file was posted
-    if 'file' not in request.files:
-        return jsonify({"error": "No file part in the request"}), 400
-    file = request.files['file']
-
-    # If no file was selected, the user might have hit the submit button without choosing a file
-    if file.filename == '':
-        return jsonify({"error": "No file selected"}), 400
-
-    # If a file is present and it has an allowed extension, secure the filename and save it to the upload folder
-    if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
+    # Reject early when the queue is full instead of letting waiting times grow, before the upload is read
+    if job_queue.pending >= job_queue.max_pending:
+        return jsonify({"error": "Too many jobs waiting, retry later"}), 503, {"Retry-After": "30"}
+
+    if request.mimetype == 'application/pdf':
+        # The body is the PDF itself, copied from the socket to disk in chunks:
+        # curl -H 'Content-Type: application/pdf' --data-binary @amdt.pdf '.../process_pdf?filename=amdt.pdf&contract=...'
+        original_filename = request.args.get('filename', 'upload.pdf')
+        contract_text = request.args.get('contract', '{}')
+        stream = request.stream
+    else:
+        # Multipart forms are parsed, and large files spooled to a temporary file, by werkzeug first
+
+        # Check if a file was posted
+        if 'file' not in request.files:
+            return jsonify({"error": "No file part in the request"}), 400
+        file = request.files['file']
+
+        # If no file was selected, the user might have hit the submit button without choosing a file
+        if file.filename == '':
+            return jsonify({"error": "No file selected"}), 400
+        original_filename = file.filename
+        contract_text = request.form.get('contract', '{}')
+        stream = file.stream
+
+    # If the file has an allowed extension, secure the filename and save it to the upload folder
+    if allowed_file(original_filename):
+        try:
+            contract = json.loads(contract_text)  # set the contract as per your requirement
+        except ValueError:
+            return jsonify({"error": "Contract is not valid JSON"}), 400
+        # Invalid contracts are rejected before the upload is queued
+        if contract:
+            try:
+                compile_contract(contract)
+            except ContractError as e:
+                return jsonify({"error": f"Invalid contract: {e}"}), 400
+
+        # Unique name, so uploads of the same file do not overwrite each other while queued
+        filename = f"{uuid.uuid4().hex}_{secure_filename(original_filename)}"
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        with open(filepath, 'wb') as destination:
+            shutil.copyfileobj(stream, destination, app.config['UPLOAD_CHUNK_SIZE'])
 
-        # Initialize the SmartWorker
-        contract = {}  # set the contract as per your requirement
-        smart_worker = PdfSmartWorker(contract)
-        response = smart_worker.process_pdf(filepath)
+        try:
+            job_id = job_queue.submit(filepath, {"contract": contract})
+        except QueueFull:
+            os.remove(filepath)
+            return jsonify({"error": "Too many jobs waiting, retry later"}), 503, {"Retry-After": "30"}
 
-        return jsonify({"result": response})
+        logging.info(f"Queued job {job_id} for {filename}")
+        return jsonify({
+            "job_id": job_id,
+            "status_url": url_for('get_job', job_id=job_id),
+            "result_url": url_for('get_job_result', job_id=job_id),
+            "events_url": url_for('get_job_events', job_id=job_id),
+        }), 202
 
     return jsonify({"error": "Unexpected error occurred"}), 500
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_queue.store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job_status(job))
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    job = job_queue.store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if job["status"] not in FINISHED:
+        return jsonify(job_status(job)), 202
+    if job["status"] != DONE:
+        return jsonify(job_status(job)), 500
+    return jsonify({"result": job["result"]})
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def get_job_events(job_id):
+    if job_queue.store.get(job_id) is None:
+        return jsonify({"error": "Unknown job"}), 404
+
+    def events():
+        # Server-sent events with the job status, sent on every change until the job finishes
+        version = job_queue.version(job_id)
+        while True:
+            job = job_queue.store.get(job_id)
+            yield f"data: {json.dumps(job_status(job))}\n\n"
+            if job["status"] in FINISHED:
+                return
+            version = job_queue.wait_for_change(job_id, version)
+
+    return Response(events(), mimetype='text/event-stream')
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus text exposition format, queue gauges are sampled on every scrape
+    tracer.metrics.set_gauge("smartworker_jobs_pending", job_queue.pending, "Jobs waiting for a worker")
+    tracer.metrics.set_gauge("smartworker_trace_spans", tracer.spans, "Spans recorded since start")
+    return Response(tracer.metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def create_app():
+    """Start the job workers and return the app: gunicorn 'app:create_app()' or flask --app 'app:create_app()' run"""
+    job_queue.start()
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    debug = True
+    # The reloader runs this file in a watching parent and in the serving child (WERKZEUG_RUN_MAIN),
+    # jobs would be requeued and run by both, so only the child starts the queue
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        create_app()
+    app.run(debug=debug)
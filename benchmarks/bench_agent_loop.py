@@ -0,0 +1,300 @@
+"""Offline, deterministic benchmark of the whole agent loop against a scripted model.
+
+Every scenario runs SmartWorkerAgent.execute() end to end: form_plan(), the experts
+polled on every step, feedback queries and the journal. The model is a ScriptedBackend
+answering plans, proposals, feedback and closure confirmations with seeded text of the
+configured sizes after a seeded latency. Experts are polled one at a time and the loop
+stops after the scenario's rounds of the plan, so runs are repeatable.
+
+Reported per scenario: steps per second, CPU time per step outside the model, peak
+Python memory (measured in a second run under tracemalloc), bytes written per step and
+the prompt size growth. Results are compared with a stored baseline, and the exit
+status is 1 when a metric regressed beyond its tolerance. Timings depend on the machine,
+refresh the baseline with --save-baseline where the benchmark runs regularly.
+
+    python benchmarks/bench_agent_loop.py [--scenario default] [--save-baseline]
+    python benchmarks/bench_agent_loop.py --record transcript.jsonl --scenario default
+    python benchmarks/bench_agent_loop.py --replay benchmarks/transcripts/default.jsonl
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from smartworkers.backends import LLMBackend
+from smartworkers.executor import CodeExecutor
+from smartworkers.journal import ConversationJournal
+from smartworkers.replay import RecordingBackend, ReplayBackend, ScriptedBackend, parse_latency
+from smartworkers.smartworker import SmartWorkerAgent
+from smartworkers.tracing import Tracer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE = os.path.join(HERE, 'baselines', 'agent_loop.json')
+
+CONTRACT = {
+    "Action": {
+        "Prompt": "Data extraction from AMDT (amendment document) of Aeronautical Information Publications (AIP).",
+        "OutputColumns": [
+            {"name": "type", "description": "Data type indication: O for Obstacle A for Airspace"},
+            {"name": "icao_identifier", "description": "ICAO code of affected airspace or airport"},
+            {"name": "vertical_amsl", "description": "Vertical information about the object in AMSL in feet (ft)"},
+            {"name": "horizontal", "description": "Horizontal points provided as JSON"},
+        ],
+        "OutputFormat": "json",
+        "SourceFileFormat": "pdf",
+        "SourceFile": "https://example.org/aip/amdt.pdf",
+    },
+    "ContractCompleteness": {"AcceptanceCriteria": "Data extracted and validated.", "ErrorAcceptance": "0%", "AmbiguityAcceptance": "5%"},
+}
+
+SCENARIOS = {
+    "default": {"plan_steps": 6, "rounds": 2, "response_chars": (300, 1500), "feedback_chars": 200, "latency": "lognormal:0.002:0.5"},
+    "long_responses": {"plan_steps": 4, "rounds": 2, "response_chars": (4000, 16000), "feedback_chars": 1000, "latency": "lognormal:0.002:0.5"},
+    "finish": {"plan_steps": 5, "rounds": 3, "response_chars": (300, 1500), "feedback_chars": 200, "latency": "0.001", "finish": True},
+}
+
+# Tolerated relative change of every metric, and whether higher values are better
+METRICS = {
+    "steps": (0.0, True),
+    "requests": (0.0, False),
+    "prompt_chars_per_request": (0.01, False),
+    "max_prompt_chars": (0.01, False),
+    "bytes_per_step": (0.01, False),
+    "steps_per_second": (0.3, True),
+    "cpu_ms_per_step": (0.3, False),
+    "peak_memory_mib": (0.15, False),
+}
+
+WORDS = ("obstacle airspace coordinates height amsl agl extract validate table section page record "
+         "icao aerodrome runway mast crane wind turbine lighting marking amendment effective date").split()
+STEP = re.compile(r"Step (\d+) of (\d+)")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def text(rng, chars: int) -> str:
+    words = []
+    size = 0
+    while size < chars:
+        word = rng.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words).capitalize() + "."
+
+
+class AgentScript:
+    """Answers of the scripted model, told apart by the prompts SmartWorkerAgent sends"""
+
+    def __init__(self, plan_steps: int, response_chars: tuple, feedback_chars: int, finish: bool = False, **_):
+        self.plan_steps = plan_steps
+        self.response_chars = response_chars
+        self.feedback_chars = feedback_chars
+        self.finish = finish
+
+    def __call__(self, messages: list[dict[str, str]], rng) -> str:
+        prompt = messages[-1]["content"]
+        if "Now I'm going to form a plan" in prompt:
+            return " ".join(f"Step {step} of {self.plan_steps}: {text(rng, 60)}" for step in range(1, self.plan_steps + 1))
+        if "Are you sure you want to proceed" in prompt:
+            return "Yes, proceed with closing the contract."
+        if "Please provide feedback on this action" in prompt:
+            return text(rng, self.feedback_chars)
+        response = text(rng, rng.randint(*self.response_chars))
+        step = STEP.search(prompt)
+        if self.finish and step is not None and step.group(1) == step.group(2):
+            response += " All steps are done. /finish_contract"
+        return response
+
+
+class BenchAgent(SmartWorkerAgent):
+    """Splits the plan without the punkt tokenizer data, which is not available offline.
+
+    The scripted plans are plain sentences without abbreviations, punkt splits them the
+    same way.
+    """
+
+    def split_plan(self, response: str) -> list[str]:
+        return SENTENCE_END.split(response.strip())
+
+
+class MeteredBackend(LLMBackend):
+    """Counts requests and prompt sizes, and the CPU time spent inside the model backend"""
+
+    def __init__(self, backend: LLMBackend):
+        self.backend = backend
+        self.requests = 0
+        self.prompt_chars = 0
+        self.max_prompt_chars = 0
+        self.cpu_time = 0.0
+        self._lock = threading.Lock()
+
+    def chat(self, messages: list[dict[str, str]], model: str, temperature: float):
+        prompt_chars = sum(len(message["content"]) for message in messages)
+        started = time.thread_time()
+        try:
+            return self.backend.chat(messages, model, temperature)
+        finally:
+            with self._lock:
+                self.cpu_time += time.thread_time() - started
+                self.requests += 1
+                self.prompt_chars += prompt_chars
+                self.max_prompt_chars = max(self.max_prompt_chars, prompt_chars)
+
+    def close(self):
+        self.backend.close()
+
+
+def directory_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def run_once(scenario: dict, backend: LLMBackend, trace: bool) -> dict:
+    """Execute the contract once in a fresh directory, journal and trace included"""
+    workdir = tempfile.mkdtemp(prefix="bench_agent_loop_")
+    previous = os.getcwd()
+    os.chdir(workdir)
+    metered = MeteredBackend(backend)
+    code_executor = CodeExecutor()
+    journal = ConversationJournal(os.path.join(workdir, "journal.jsonl"))
+    tracer = Tracer(os.path.join(workdir, "trace.jsonl")) if trace else None
+    agent = BenchAgent("sk-fake", "gpt-4", max_concurrent_experts=1, backend=metered, journal=journal,
+                             code_executor=code_executor, tracer=tracer, round_delay=0, max_rounds=scenario["rounds"])
+    agent.load_contract(CONTRACT)
+    try:
+        gc.collect()
+        wall, cpu = time.perf_counter(), time.process_time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = agent.execute()
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        journal.close()
+        if tracer is not None:
+            tracer.close()
+        return {
+            "result": result,
+            "steps": agent.plan_position,
+            "requests": metered.requests,
+            "prompt_chars": metered.prompt_chars,
+            "max_prompt_chars": metered.max_prompt_chars,
+            "wall": wall,
+            "cpu_outside_model": cpu - metered.cpu_time,
+            "bytes_written": directory_size(workdir),
+        }
+    finally:
+        code_executor.shutdown()
+        os.chdir(previous)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def measure(scenario: dict, make_backend, trace: bool) -> dict:
+    run = run_once(scenario, make_backend(), trace)
+    # The backend is built first, so a loaded transcript does not count towards the peak
+    backend = make_backend()
+    tracemalloc.start()
+    try:
+        run_once(scenario, backend, trace)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    steps = max(run["steps"], 1)
+    return {
+        "steps": run["steps"],
+        "requests": run["requests"],
+        "prompt_chars_per_request": round(run["prompt_chars"] / max(run["requests"], 1), 1),
+        "max_prompt_chars": run["max_prompt_chars"],
+        "bytes_per_step": round(run["bytes_written"] / steps, 1),
+        "steps_per_second": round(run["steps"] / run["wall"], 2),
+        "cpu_ms_per_step": round(run["cpu_outside_model"] * 1000 / steps, 3),
+        "peak_memory_mib": round(peak / 2 ** 20, 2),
+        "finished": run["result"] == "/finish_contract",
+    }
+
+
+def compare(name: str, metrics: dict, baseline: dict) -> list[str]:
+    """Print the metrics next to the baseline, returns the regressed metric names"""
+    regressions = []
+    print(f"{name}:")
+    for metric, (tolerance, higher_is_better) in METRICS.items():
+        value = metrics[metric]
+        expected = baseline.get(metric)
+        if expected is None:
+            print(f"  {metric:>26}: {value}")
+            continue
+        change = (value - expected) / expected if expected else (0.0 if value == expected else float("inf"))
+        worse = -change if higher_is_better else change
+        flag = "REGRESSION" if worse > tolerance else ""
+        if flag:
+            regressions.append(f"{name}.{metric}")
+        print(f"  {metric:>26}: {value} (baseline {expected}, {change:+.1%}) {flag}")
+    print(f"  {'finished':>26}: {metrics['finished']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help="Scenario to run, all by default")
+    parser.add_argument('--latency', help="Latency distribution overriding the scenario, such as lognormal:0.05:0.6")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--trace', action='store_true', help="Run with a Tracer writing trace.jsonl")
+    parser.add_argument('--record', help="Write the model answers of the scenario to this transcript")
+    parser.add_argument('--replay', help="Answer with a recorded transcript instead of the scripted model")
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="Store the results as the new baseline")
+    args = parser.parse_args()
+
+    if args.replay:
+        header = ReplayBackend(args.replay).header
+        names = [header["scenario"]]
+    else:
+        names = args.scenario or list(SCENARIOS)
+    if args.record and len(names) != 1:
+        parser.error("--record needs a single --scenario")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    results, regressions = {}, []
+    for name in names:
+        scenario = SCENARIOS[name]
+        latency = parse_latency(args.latency or scenario["latency"])
+        script = AgentScript(**scenario)
+        if args.replay:
+            make_backend = lambda: ReplayBackend(args.replay, latency=latency, seed=args.seed)
+        else:
+            make_backend = lambda: ScriptedBackend(script, latency, args.seed)
+        if args.record:
+            recorded = RecordingBackend(make_backend(), args.record, {"scenario": name, "seed": args.seed})
+            run_once(scenario, recorded, args.trace)
+            recorded.close()
+            print(f"Recorded scenario {name} to {args.record}")
+            return
+
+        # Traced runs also write the trace file, they have baselines of their own
+        key = f"{name}+trace" if args.trace else name
+        results[key] = measure(scenario, make_backend, args.trace)
+        regressions += compare(key, results[key], baseline.get(key, {}))
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as file:
+            json.dump(dict(baseline, **results), file, indent=2, sort_keys=True)
+            file.write("\n")
+        print(f"Saved baseline of {', '.join(results)} to {args.baseline}")
+    elif regressions:
+        print(f"Regressed: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
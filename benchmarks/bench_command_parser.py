@@ -0,0 +1,58 @@
+"""Throughput of the command parser on multi-megabyte responses.
+
+Parses a synthetic response made of prose, commands and large fenced /write_file
+payloads, once in a single call and once fed in token sized chunks.
+
+    python benchmarks/bench_command_parser.py [--megabytes 4] [--chunk 16]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from smartworkers.commands import CommandParser, parse_commands
+
+
+def make_response(megabytes: float) -> str:
+    section = (
+        "The Architect proposes to split the AMDT document into page ranges and extract obstacles.\n"
+        "/write_file extract_part.py\n"
+        "```python\n"
+        + "rows.append({'type': 'O', 'vertical_amsl': 1234, 'path': '/tmp/out'})  # /run_code is not a command here\n" * 200
+        + "```\n"
+        "Then /run_code extract_part.py and compare the output with the second extraction.\n"
+    )
+    return section * max(1, int(megabytes * 1024 * 1024 / len(section)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--megabytes', type=float, default=4)
+    parser.add_argument('--chunk', type=int, default=16, help="characters per streamed chunk")
+    args = parser.parse_args()
+
+    response = make_response(args.megabytes)
+    size = len(response) / (1024 * 1024)
+
+    start = time.perf_counter()
+    commands = parse_commands(response)
+    whole = time.perf_counter() - start
+
+    start = time.perf_counter()
+    streaming = CommandParser()
+    streamed = []
+    for offset in range(0, len(response), args.chunk):
+        streamed.extend(streaming.feed(response[offset:offset + args.chunk]))
+    streamed.extend(streaming.close())
+    chunked = time.perf_counter() - start
+
+    assert streamed == commands
+    print(f"response: {size:.2f} MB, {len(commands)} commands")
+    print(f"single call: {size / whole:8.1f} MB/s")
+    print(f"{args.chunk:>4} char chunks: {size / chunked:8.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Request payload size and tokenization overhead versus conversation length.
+
+For every conversation length the benchmark builds one request without a budget,
+then with a ContextWindow (first call tokenizes, second call uses cached counts).
+
+    python benchmarks/bench_context_window.py [--lengths 10 100 1000 5000] [--max-tokens 8192]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from smartworkers.context import ContextWindow, RollingSummaryPolicy, SlidingWindowPolicy
+
+
+def make_conversation(length: int) -> list:
+    messages = [{"role": "user", "content": "[SYSTEM INFORMATION] CompuLingo preamble. " * 60},
+                {"role": "system", "content": "Your task is to complete the given contract. " * 20}]
+    for turn in range(length):
+        role = "assistant" if turn % 2 else "user"
+        messages.append({"role": role, "content": f"Turn {turn}. " + "Extracted obstacle data and coordinates. " * 25})
+    return messages
+
+
+def measure(window: ContextWindow, messages: list, new_message: dict) -> (int, float, float):
+    start = time.perf_counter()
+    request = window.build(messages, new_message)
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    window.build(messages, new_message)
+    warm = time.perf_counter() - start
+    return len(json.dumps(request)), cold, warm
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lengths', type=int, nargs='+', default=[10, 100, 1000, 5000])
+    parser.add_argument('--max-tokens', type=int, default=8192)
+    args = parser.parse_args()
+
+    new_message = {"role": "user", "content": "Next step of the plan."}
+    print(f"{'turns':>6} {'full bytes':>11} {'policy':>8} {'sent bytes':>11} {'cold ms':>8} {'warm ms':>8} {'tokens saved':>13}")
+    for length in args.lengths:
+        messages = make_conversation(length)
+        full_bytes = len(json.dumps(messages + [new_message]))
+        for name, policy in (("sliding", SlidingWindowPolicy()), ("summary", RollingSummaryPolicy())):
+            window = ContextWindow(args.max_tokens, policy=policy)
+            sent_bytes, cold, warm = measure(window, messages, new_message)
+            saved = window.stats()["tokens_saved"] // window.stats()["requests"]
+            print(f"{length:>6} {full_bytes:>11} {name:>8} {sent_bytes:>11} {cold * 1000:>8.2f} {warm * 1000:>8.2f} {saved:>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Contract loading and get_llm_prompt cost with thousands of contracts in the scheduler.
+
+Every contract runs on an agent whose conversation already holds --history messages,
+and execute() asks for the contract prompt --calls times, adding a message in between
+as a plan step would. The legacy agent parses the contract JSON on every call and
+scans the conversation for the contract text, the compiled one renders the prompt
+once and checks the contract hash.
+
+    python benchmarks/bench_contracts.py [--contracts 5000] [--history 200] [--calls 10]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from smartworkers.backends import LLMBackend
+from smartworkers.commands import FinishContract
+from smartworkers.contract import compile_contracts
+from smartworkers.conversation import Conversation
+from smartworkers.executor import CodeExecutor
+from smartworkers.scheduler import ContractScheduler
+from smartworkers.smartworker import SmartWorkerAgent
+
+
+def synthetic_contracts(count: int) -> str:
+    contracts = []
+    for index in range(count):
+        contracts.append({
+            "Action": {
+                "Prompt": f"Data extraction from AMDT {index} of Aeronautical Information Publications (AIP).",
+                "OutputColumns": [
+                    {"name": "type", "description": "Data type indication: O for Obstacle A for Airspace"},
+                    {"name": "icao_identifier", "description": "ICAO code of affected airspace or airport"},
+                    {"name": "vertical_amsl", "description": "Vertical information about the object in AMSL in feet (ft)"},
+                    {"name": "horizontal", "description": "Horizontal points provided as JSON"},
+                ],
+                "OutputFormat": "json",
+                "SourceFileFormat": "pdf",
+                "SourceFile": f"https://example.org/aip/amdt_{index}.pdf",
+            },
+            "ContractCompleteness": {"AcceptanceCriteria": "Data extracted and validated.", "ErrorAcceptance": "0%", "AmbiguityAcceptance": "5%"},
+            "Value": {"Budget": f"{index % 20 + 1} DOT"},
+        })
+    return json.dumps(contracts)
+
+
+class LegacyPromptAgent(SmartWorkerAgent):
+    """get_llm_prompt as it was before contracts were compiled"""
+
+    def load_contract(self, contract):
+        self.contract = contract.to_json()
+
+    def get_llm_prompt(self) -> str:
+        contract = json.loads(self.contract)
+        action = contract[0]["Action"]
+        output_columns = ", ".join([f"{column['name']} ({column['description']})" for column in action['OutputColumns']])
+        prompt = f"{action['Prompt']} The output should be in {action['OutputFormat']} format and contain the following fields: {output_columns}. "
+        prompt += f"Acceptance criteria: {contract[0]['ContractCompleteness']['AcceptanceCriteria']}."
+        prompt += f"PDF file is aviable in {action['SourceFile']}."
+        if not any(message["role"] == "system" and prompt in message["content"] for message in self.messages):
+            self.add_message({"role": "system", "content": f"You are a helpful assistant. Your task is to understand and complete the given contract: {prompt}"})
+        return prompt
+
+
+def prompt_steps(agent: SmartWorkerAgent, calls: int) -> str:
+    for step in range(calls):
+        agent.get_llm_prompt()
+        agent.add_message({"role": "assistant", "content": f"Step {step} done."})
+    # Counted as a finished contract by the scheduler
+    return f"/{FinishContract.name}"
+
+
+def run(agent_class, contracts: str, history: Conversation, calls: int, agents: int) -> (float, dict):
+    backend = LLMBackend()  # never called, execute() only builds prompts
+    code_executor = CodeExecutor()
+
+    def create_agent(job):
+        agent = agent_class("sk-fake", "gpt-4", backend=backend, conversation=history, code_executor=code_executor)
+        agent.execute = lambda: prompt_steps(agent, calls)
+        return agent
+
+    scheduler = ContractScheduler(create_agent, max_agents=agents)
+    start = time.perf_counter()
+    scheduler.submit(contracts)
+    submitted = time.perf_counter() - start
+    scheduler.run()
+    code_executor.shutdown()
+    return submitted, scheduler.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--contracts', type=int, default=5000)
+    parser.add_argument('--history', type=int, default=200)
+    parser.add_argument('--calls', type=int, default=10)
+    parser.add_argument('--agents', type=int, default=4)
+    args = parser.parse_args()
+
+    contracts = synthetic_contracts(args.contracts)
+    history = Conversation([{"role": "user" if index % 2 else "system", "content": f"Earlier message {index}. " * 40}
+                            for index in range(args.history)]).freeze()
+
+    start = time.perf_counter()
+    compile_contracts(contracts)
+    compiled = time.perf_counter() - start
+    start = time.perf_counter()
+    compile_contracts(contracts)
+    recompiled = time.perf_counter() - start
+    print(f"contracts={args.contracts} history={args.history} calls={args.calls}")
+    print(f"compile: {compiled * 1000:.1f}ms, same contracts again {recompiled * 1000:.3f}ms")
+
+    for label, agent_class in (("legacy", LegacyPromptAgent), ("compiled", SmartWorkerAgent)):
+        submitted, stats = run(agent_class, contracts, history, args.calls, args.agents)
+        print(f"{label:>8}: submit {submitted * 1000:.1f}ms, run {stats['elapsed']:.2f}s, "
+              f"{stats['contracts_per_hour']:.0f} contracts/hour, done={stats['done']} failed={stats['failed']}")
+
+
+if __name__ == '__main__':
+    main()
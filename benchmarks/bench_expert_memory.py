@@ -0,0 +1,105 @@
+"""Memory per added expert, as the baseline built experts versus forked conversations.
+
+Both variants create --experts experts the way execute() does and let every expert
+converse --turns times with an in-process model answering --response-chars. The
+baseline Expert needed the openai 0.x module, its state is rebuilt field for field:
+a private list of message dicts starting with the preamble literal, shared by all
+instances, and a memory list. The current experts come from create_expert() and branch
+off the shared preamble. Responses are new strings of the same size in both variants.
+
+    python benchmarks/bench_expert_memory.py [--experts 100] [--turns 5] [--response-chars 1000]
+"""
+import argparse
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from smartworkers.backends import Completion, LLMBackend
+from smartworkers.smartworker import SYSTEM_MESSAGE, SmartWorkerAgent
+
+ORCHESTRATOR_NOTE = "[MESSAGE FROM ORCHESTRATOR] If needed, Please include one of the following commands in your response as appropriate: /return_contract, /finish_contract, /run_code, /write_file, /read_file."
+
+
+class AnswerBackend(LLMBackend):
+    """Answers every request at once with a new response of the given size"""
+
+    def __init__(self, response_chars: int):
+        self.response_chars = response_chars
+        self.requests = 0
+
+    def chat(self, messages: list[dict[str, str]], model: str, temperature: float):
+        self.requests += 1
+        prefix = f"Answer {self.requests}: "
+        return Completion(prefix + "x" * (self.response_chars - len(prefix)), model)
+
+
+class BaselineExpert:
+    """The state of the baseline Expert and what its converse() added to it"""
+
+    def __init__(self, gpt_api_key: str, backend: LLMBackend):
+        self.memory = []
+        self.gpt_model = None
+        self.gpt_api_key = gpt_api_key
+        self.contract = None
+        self.messages = [{"role": "user", "content": SYSTEM_MESSAGE}]
+        self.backend = backend
+
+    def converse(self, prompt):
+        self.memory.append(prompt)
+        new_message = {"role": "user", "content": str(self.memory[-1]) + ORCHESTRATOR_NOTE}
+        response = self.backend.chat(self.messages + [new_message], "gpt-4", 0.1).content
+        self.messages.append({"role": "assistant", "content": response})
+        # The baseline get_feedback() returned the response itself
+        return response, response
+
+
+def baseline_experts(backend: LLMBackend, experts: int, turns: int) -> list:
+    created = [BaselineExpert("sk-fake", backend) for _ in range(experts)]
+    converse(created, turns)
+    return created
+
+
+def forked_experts(backend: LLMBackend, experts: int, turns: int) -> list:
+    orchestrator = SmartWorkerAgent("sk-fake", "gpt-4", backend=backend)
+    created = [orchestrator.create_expert(index) for index in range(experts)]
+    converse(created, turns)
+    return created
+
+
+def converse(experts: list, turns: int):
+    for turn in range(turns):
+        prompt = f"Step {turn + 1} of the plan: extract the obstacles listed in the amendment."
+        for expert in experts:
+            expert.converse(prompt)
+
+
+def measure(build, experts: int, turns: int, response_chars: int) -> int:
+    backend = AnswerBackend(response_chars)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    created = build(backend, experts, turns)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del created
+    return (after - before) // experts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--experts', type=int, default=100)
+    parser.add_argument('--turns', type=int, default=5)
+    parser.add_argument('--response-chars', type=int, default=1000)
+    args = parser.parse_args()
+
+    baseline = measure(baseline_experts, args.experts, args.turns, args.response_chars)
+    forked = measure(forked_experts, args.experts, args.turns, args.response_chars)
+    responses = args.turns * args.response_chars
+    print(f"experts={args.experts}, {args.turns} turns per expert, {args.response_chars} chars per response")
+    print(f"baseline experts: {baseline:>10} bytes per expert ({baseline - responses} besides the responses)")
+    print(f"forked experts:   {forked:>10} bytes per expert ({forked - responses} besides the responses)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Latency benchmark of one execute() step against a local fake LLM endpoint.
+
+Every expert query takes LATENCY seconds on the fake endpoint, so a sequential
+step costs roughly experts * LATENCY while a concurrent one costs roughly LATENCY.
+
+    python benchmarks/bench_expert_polling.py [--experts 3] [--latency 0.2]
+"""
+import argparse
+import itertools
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from smartworkers.backends import OpenAIBackend
+from smartworkers.smartworker import SmartWorkerAgent, Expert
+from smartworkers.stub_server import StubLLMServer
+from smartworkers.voting import ResponseHistory
+
+
+def time_step(backend: OpenAIBackend, concurrency: int, experts: int, steps: int) -> float:
+    # Every expert is polled, the quorum would otherwise stop early on agreement
+    agent = SmartWorkerAgent("sk-fake", "gpt-4", max_concurrent_experts=concurrency, backend=backend, quorum=experts)
+    pool = [Expert("sk-fake", backend=backend) for _ in range(experts)]
+    executor = ThreadPoolExecutor(max_workers=concurrency) if concurrency > 1 else None
+
+    past_responses = ResponseHistory()
+    common_memory = []
+    start = time.perf_counter()
+    for step in range(steps):
+        common_memory.append(f"Step {step}")
+        vote = agent.poll_experts(pool, common_memory[-1], past_responses, common_memory, executor)
+        past_responses.update(vote.responses, vote.fingerprints)
+    elapsed = (time.perf_counter() - start) / steps
+
+    if executor is not None:
+        executor.shutdown()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--experts', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--steps', type=int, default=5)
+    args = parser.parse_args()
+
+    counter = itertools.count()
+    os.chdir(tempfile.mkdtemp())
+
+    with StubLLMServer(lambda payload: f"Proposal {next(counter)}", args.latency) as server:
+        backend = OpenAIBackend("sk-fake", api_base=server.url, pool_size=args.experts)
+        sequential = time_step(backend, 1, args.experts, args.steps)
+        concurrent = time_step(backend, args.experts, args.experts, args.steps)
+        backend.close()
+
+    print(f"experts={args.experts} latency={args.latency:.3f}s")
+    print(f"sequential step: {sequential:.3f}s (sum of latencies {args.experts * args.latency:.3f}s)")
+    print(f"concurrent step: {concurrent:.3f}s (max latency {args.latency:.3f}s)")
+    print(f"speedup: {sequential / concurrent:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Latency of the resilient backend against a fault injecting fake LLM endpoint.
+
+Four scenarios are timed:
+  - retries: every third request fails with 429/503 or a dropped connection.
+  - retry_after: every query is first rejected with 429 and a short Retry-After.
+  - hedging: one request in twenty is slow, the p50/p95/p99 latency with and without
+    hedged requests is compared.
+  - breaker: the endpoint is down, the time to fail --queries queries once the circuit
+    is open.
+
+The behaviour itself is covered by tests/test_resilience.py.
+
+    python benchmarks/bench_resilience.py [--queries 100] [--latency 0.02] [--slow 0.5]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from smartworkers.backends import OpenAIBackend
+from smartworkers.resilience import CircuitBreaker, CircuitOpenError, ResilientBackend, RetryPolicy
+from smartworkers.stub_server import StubLLMServer
+
+MESSAGES = [{"role": "user", "content": "Extract the obstacles."}]
+
+def percentile(samples: list[float], percentile: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+def timed_queries(backend, queries: int) -> list[float]:
+    latencies = []
+    for _ in range(queries):
+        start = time.perf_counter()
+        backend.chat(MESSAGES, "gpt-4", 0.1)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def retries(queries: int, latency: float):
+    kinds = [503, "drop", 429]
+    injected = []
+
+    def faults(index, payload):
+        fault = kinds[index // 3 % 3] if index % 3 == 0 else None
+        if fault is not None:
+            injected.append(fault)
+        return fault
+
+    with StubLLMServer(["Obstacle list."], latency, faults=faults) as server:
+        backend = ResilientBackend(OpenAIBackend("sk-fake", api_base=server.url), RetryPolicy(base_delay=0.01))
+        samples = timed_queries(backend, queries)
+        print(f"retries: {queries} queries, {len(server.requests)} requests, {len(injected)} faults, "
+              f"p50={percentile(samples, 50) * 1000:.1f}ms p99={percentile(samples, 99) * 1000:.1f}ms {backend.stats()}")
+        backend.close()
+
+
+def retry_after(queries: int, latency: float, wait: float = 0.05):
+    # The backoff of the policy alone would wait seconds per query
+    with StubLLMServer(["Obstacle list."], latency, faults=lambda index, payload: 429 if index % 2 == 0 else None, retry_after=wait) as server:
+        backend = ResilientBackend(OpenAIBackend("sk-fake", api_base=server.url), RetryPolicy(base_delay=10, max_delay=30))
+        queries = min(queries, 10)
+        start = time.perf_counter()
+        timed_queries(backend, queries)
+        elapsed = time.perf_counter() - start
+        print(f"retry_after: {queries} queries rejected once with Retry-After {wait}s, {elapsed:.2f}s, {backend.stats()}")
+        backend.close()
+
+
+def hedging(queries: int, latency: float, slow: float):
+    rng = random.Random(7)
+    tail = lambda: slow if rng.random() < 0.05 else latency
+    with StubLLMServer(["Obstacle list."], tail) as server:
+        for hedge_percentile in (None, 90):
+            backend = ResilientBackend(OpenAIBackend("sk-fake", api_base=server.url), hedge_percentile=hedge_percentile)
+            # Hedging starts once enough latencies are known to estimate the percentile
+            timed_queries(backend, backend.latencies.min_samples)
+            samples = timed_queries(backend, queries)
+            label = "no hedging" if hedge_percentile is None else f"hedged at p{hedge_percentile}"
+            slow_queries = sum(sample >= slow for sample in samples)
+            print(f"hedging ({label}): p50={percentile(samples, 50) * 1000:.1f}ms p95={percentile(samples, 95) * 1000:.1f}ms p99={percentile(samples, 99) * 1000:.1f}ms slow={slow_queries} {backend.stats()}")
+            backend.close()
+
+
+def breaker(queries: int, failure_threshold: int):
+    with StubLLMServer(faults=lambda index, payload: 500) as server:
+        backend = ResilientBackend(OpenAIBackend("sk-fake", api_base=server.url), RetryPolicy(max_attempts=2, base_delay=0.01),
+                                   CircuitBreaker(failure_threshold, reset_timeout=60))
+        rejected = 0
+        start = time.perf_counter()
+        for _ in range(queries):
+            try:
+                backend.chat(MESSAGES, "gpt-4", 0.1)
+            except CircuitOpenError:
+                rejected += 1
+            except Exception:
+                pass
+        elapsed = time.perf_counter() - start
+        print(f"breaker: {len(server.requests)} requests reached the endpoint, {rejected}/{queries} queries failed fast, {elapsed:.2f}s, {backend.stats()}")
+        backend.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--slow', type=float, default=0.5)
+    parser.add_argument('--failure-threshold', type=int, default=5)
+    args = parser.parse_args()
+
+    retries(args.queries, args.latency)
+    retry_after(args.queries, args.latency)
+    hedging(args.queries, args.latency, args.slow)
+    breaker(args.queries, args.failure_threshold)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Overhead of tracing on expert polling with an instant in-process backend.
+
+The backend answers immediately, so the difference between the untraced and traced
+runs is the cost of the spans, the token accounting and the JSONL trace file. Real
+model requests take hundreds of milliseconds, the overhead per query is compared
+with that.
+
+    python benchmarks/bench_tracing.py [--steps 2000] [--experts 3]
+"""
+import argparse
+import itertools
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from smartworkers.backends import Completion, LLMBackend
+from smartworkers.smartworker import Expert, SmartWorkerAgent
+from smartworkers.tracing import NULL_TRACER, Tracer
+from smartworkers.voting import ResponseHistory
+
+
+class InstantBackend(LLMBackend):
+    def __init__(self):
+        self.counter = itertools.count()
+
+    def chat(self, messages: list[dict[str, str]], model: str, temperature: float) -> Completion:
+        return Completion(f"Proposal {next(self.counter)}", model, {"prompt_tokens": 900, "completion_tokens": 120})
+
+
+def run(tracer, steps: int, experts: int, concurrency: int) -> (float, int):
+    backend = InstantBackend()
+    agent = SmartWorkerAgent("sk-fake", "gpt-4", max_concurrent_experts=concurrency, backend=backend, quorum=experts, tracer=tracer)
+    pool = [Expert("sk-fake", backend=backend, tracer=tracer) for _ in range(experts)]
+    executor = ThreadPoolExecutor(max_workers=concurrency) if concurrency > 1 else None
+
+    past_responses = ResponseHistory()
+    common_memory = []
+    start = time.perf_counter()
+    for step in range(steps):
+        with tracer.span("step", step=step):
+            common_memory.append(f"Step {step}")
+            vote = agent.poll_experts(pool, common_memory[-1], past_responses, common_memory, executor)
+            past_responses.update(vote.responses, vote.fingerprints)
+    elapsed = time.perf_counter() - start
+
+    if executor is not None:
+        executor.shutdown()
+    return elapsed, steps * experts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--steps', type=int, default=2000)
+    parser.add_argument('--experts', type=int, default=3)
+    parser.add_argument('--concurrency', type=int, default=3)
+    args = parser.parse_args()
+    os.chdir(tempfile.mkdtemp())
+
+    untraced, queries = run(NULL_TRACER, args.steps, args.experts, args.concurrency)
+    tracer = Tracer("trace.jsonl")
+    traced, _ = run(tracer, args.steps, args.experts, args.concurrency)
+    tracer.close()
+
+    overhead = (traced - untraced) / queries
+    print(f"steps={args.steps} experts={args.experts} queries={queries}")
+    print(f"untraced: {untraced:.2f}s ({untraced / queries * 1e6:.0f}us per query)")
+    print(f"traced:   {traced:.2f}s ({traced / queries * 1e6:.0f}us per query), {tracer.spans} spans, "
+          f"trace file {os.path.getsize('trace.jsonl') / 1024:.0f} KiB")
+    print(f"overhead: {overhead * 1e6:.0f}us per query, {overhead / 0.5:.4%} of a 500ms model request")
+    print("TRACE:", tracer.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Throughput of the columnar Validator on synthetic AIP obstacle extractions.
+
+Generates --rows rows with a seeded share of invalid cells, plus a second extraction
+run that disagrees on a few heights and misses a few rows, then times the validation
+and double-extraction diff. A straightforward per-row Python check of the same rules
+is timed as a reference and must agree on the number of invalid rows.
+
+    python benchmarks/bench_validator.py [--rows 200000] [--errors 0.02]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from smartworkers.contract import compile_contract
+from smartworkers.validator import COORDINATES, NUMBER, Validator
+
+CONTRACT = {
+    "Action": {
+        "Prompt": "Data extraction from AMDT (amendment document) of Aeronautical Information Publications (AIP).",
+        "OutputColumns": [
+            {"name": "type", "description": "Data type indication: O for Obstacle A for Airspace"},
+            {"name": "icao_identifier", "description": "ICAO code of affected airspace or airport"},
+            {"name": "details", "description": "Details of airspace or obstacle"},
+            {"name": "vertical_amsl", "description": "Vertical information about the object in AMSL in feet (ft)"},
+            {"name": "vertical_agl", "description": "Vertical AGL information if provided"},
+            {"name": "horizontal", "description": "Horizontal points provided as JSON"},
+        ],
+        "OutputFormat": "json",
+    },
+    "ContractCompleteness": {"AcceptanceCriteria": "Data extracted and validated.", "ErrorAcceptance": "0%", "AmbiguityAcceptance": "5%"},
+}
+POINT = re.compile(r"^(\d{2})(\d{2})(\d{2})(\.\d+)?[NS](\d{3})(\d{2})(\d{2})(\.\d+)?[EW]$")
+
+
+def point(rng: random.Random) -> str:
+    return f"{rng.randint(49, 54):02d}{rng.randint(0, 59):02d}{rng.randint(0, 59):02d}N {rng.randint(14, 24):03d}{rng.randint(0, 59):02d}{rng.randint(0, 59):02d}E"
+
+
+def synthetic_rows(count: int, error_rate: float, seed: int = 7) -> list[dict]:
+    rng = random.Random(seed)
+    rows = []
+    for index in range(count):
+        row = {
+            "type": rng.choice("OA"),
+            "icao_identifier": rng.choice(["EPWA", "EPKK", "EPGD", "EPWR"]),
+            "details": f"Obstacle {index}",
+            "vertical_amsl": f"{rng.randint(100, 3000)} ft",
+            "vertical_agl": str(rng.randint(10, 400)) if rng.random() < 0.7 else None,
+            "horizontal": [point(rng) for _ in range(rng.choice((1, 1, 1, 4)))],
+        }
+        if rng.random() < error_rate:
+            column, value = rng.choice([("type", "X"), ("vertical_amsl", "high"), ("vertical_agl", "9000"), ("horizontal", "52.2, 20.9"), ("icao_identifier", None)])
+            row[column] = value
+        rows.append(row)
+    return rows
+
+
+def second_run(rows: list[dict], seed: int = 11) -> list[dict]:
+    rng = random.Random(seed)
+    run = []
+    for row in rows:
+        roll = rng.random()
+        if roll < 0.005:
+            continue
+        run.append(dict(row, vertical_amsl="1 ft") if roll < 0.015 else row)
+    return run
+
+
+def per_row_errors(validator: Validator, rows: list[dict]) -> int:
+    invalid_rows = 0
+    for row in rows:
+        invalid = False
+        for rule in validator.rules:
+            value = row.get(rule.name)
+            if value in (None, "", []):
+                invalid |= rule.required
+                continue
+            if rule.kind == NUMBER:
+                text = str(value).lower().replace("ft", "").replace(",", "").strip()
+                try:
+                    number = float(text)
+                except ValueError:
+                    invalid = True
+                    continue
+                invalid |= not rule.minimum <= number <= rule.maximum
+            elif rule.kind == COORDINATES:
+                points = value if isinstance(value, list) else [value]
+                for item in points:
+                    match = POINT.match(str(item).replace(" ", ""))
+                    if match is None:
+                        invalid = True
+                        continue
+                    latitude, longitude = int(match.group(1)), int(match.group(5))
+                    minutes = [int(match.group(group)) for group in (2, 3, 6, 7)]
+                    fractions = [float(match.group(group) or 0) for group in (4, 8)]
+                    invalid |= latitude > 90 or longitude > 180 or max(minutes) >= 60
+                    # Only the pole and the antimeridian themselves have 90 and 180 degrees
+                    invalid |= latitude == 90 and (minutes[0] or minutes[1] or fractions[0])
+                    invalid |= longitude == 180 and (minutes[2] or minutes[3] or fractions[1])
+            elif rule.choices:
+                invalid |= str(value).upper() not in rule.choices
+        invalid_rows += invalid
+    return invalid_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--errors', type=float, default=0.02)
+    args = parser.parse_args()
+
+    rows = synthetic_rows(args.rows, args.errors)
+    second = second_run(rows)
+    validator = Validator(compile_contract(CONTRACT))
+
+    start = time.perf_counter()
+    report = validator.validate(rows)
+    validated = time.perf_counter() - start
+    start = time.perf_counter()
+    double = validator.validate(rows, second)
+    diffed = time.perf_counter() - start
+    start = time.perf_counter()
+    reference = per_row_errors(validator, rows)
+    per_row = time.perf_counter() - start
+
+    print(f"rows={args.rows} error_rate={args.errors}")
+    print(f"columnar validation: {validated:.2f}s ({args.rows / validated:,.0f} rows/s), error_ratio={report.error_ratio:.4f}")
+    print(f"with double extraction: {diffed:.2f}s, ambiguity_ratio={double.ambiguity_ratio:.4f}, {double.diff.as_dict()}")
+    print(f"per-row reference: {per_row:.2f}s, invalid rows {reference} vs {int(report.error_rows.sum())}")
+    print(f"passed={double.passed} (ErrorAcceptance={double.error_acceptance}, AmbiguityAcceptance={double.ambiguity_acceptance})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""LLM calls per step and decisions of exact-match voting versus quorum voting.
+
+Replays transcripts where every line is one plan step with the responses each expert
+gave, in expert order:
+    {"prompt": "...", "responses": ["...", "...", "..."]}
+Without --transcript a seeded synthetic transcript is generated, in which experts
+mostly agree up to whitespace and case changes.
+
+Revisions are counted as two calls (feedback and revised response) and are assumed
+to produce a fresh response.
+
+    python benchmarks/bench_voting.py [--transcript steps.jsonl ...] [--steps 500] [--experts 3]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from smartworkers.voting import QuorumVote, ResponseHistory, normalize_response
+
+
+def synthetic_transcript(steps: int, experts: int, seed: int = 7) -> list:
+    generator = random.Random(seed)
+    transcript = []
+    for step in range(steps):
+        answer = f"Step {step}: extract obstacles from pages {step * 4}-{step * 4 + 3} and write rows as JSON with AMSL and AGL heights."
+        responses = []
+        for _ in range(experts):
+            roll = generator.random()
+            if roll < 0.6:
+                responses.append(answer.replace(" ", generator.choice([" ", "  ", "\n"]), 3))
+            elif roll < 0.85:
+                responses.append(answer.upper())
+            else:
+                responses.append(f"Step {step}: first download the document again, {generator.random()}")
+        transcript.append({"prompt": f"Step {step}", "responses": responses})
+    return transcript
+
+
+def exact_voting(transcript: list) -> (int, list):
+    calls = 0
+    decisions = []
+    past_responses = set()
+    for step in transcript:
+        proposed = []
+        for response in step["responses"]:
+            calls += 1
+            if response in past_responses:
+                calls += 2
+            past_responses.add(response)
+            proposed.append(response)
+        decisions.append(max(proposed, key=proposed.count))
+    return calls, decisions
+
+
+def quorum_voting(transcript: list, experts: int, quorum: int) -> (int, list):
+    calls = 0
+    decisions = []
+    history = ResponseHistory(max_entries=1000)
+    for step in transcript:
+        vote = QuorumVote(quorum, history.threshold, history.hasher)
+        remaining = list(step["responses"][:experts])
+        while remaining and not vote.reached:
+            wave, remaining = remaining[:vote.needed], remaining[vote.needed:]
+            for response in wave:
+                calls += 1
+                if response in history:
+                    calls += 2
+                vote.add(response, None)
+        history.update(vote.responses)
+        decisions.append(vote.winner[0])
+    return calls, decisions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--transcript', nargs='*', default=[])
+    parser.add_argument('--steps', type=int, default=500)
+    parser.add_argument('--experts', type=int, default=3)
+    parser.add_argument('--quorum', type=int, default=None)
+    args = parser.parse_args()
+
+    transcript = []
+    for path in args.transcript:
+        with open(path) as file:
+            transcript.extend(json.loads(line) for line in file if line.strip())
+    if not transcript:
+        transcript = synthetic_transcript(args.steps, args.experts)
+    quorum = args.quorum or args.experts // 2 + 1
+
+    exact_calls, exact_decisions = exact_voting(transcript)
+    start = time.perf_counter()
+    quorum_calls, quorum_decisions = quorum_voting(transcript, args.experts, quorum)
+    elapsed = time.perf_counter() - start
+
+    same = sum(normalize_response(a) == normalize_response(b) for a, b in zip(exact_decisions, quorum_decisions))
+    steps = len(transcript)
+    print(f"steps={steps} experts={args.experts} quorum={quorum}")
+    print(f"exact-match voting: {exact_calls / steps:.2f} LLM calls per step")
+    print(f"quorum voting:      {quorum_calls / steps:.2f} LLM calls per step, {elapsed / steps * 1000:.2f} ms voting overhead per step")
+    print(f"same decision (normalized): {same / steps:.1%}")
+
+
+if __name__ == "__main__":
+    main()
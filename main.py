@@ -1,5 +1,12 @@
 #from smartworkers.smartworker import SmartWorker
 from smartworkers.smartworker import SmartWorkerAgent
+from smartworkers.cache import ResponseCache
+from smartworkers.journal import ConversationJournal
+from smartworkers.backends import OpenAIBackend
+from smartworkers.ratelimit import RateLimiter, RateLimitedBackend
+from smartworkers.resilience import ResilientBackend
+from smartworkers.scheduler import ContractScheduler
+from smartworkers.tracing import Tracer
 import os
 import nltk
 import json
@@ -47,15 +54,35 @@ def main():
     """
 
     print(contract_string)
-    worker = SmartWorkerAgent(OPENAI_API_KEY, "gpt-4")
+    # Replays of the same contract are answered from the on-disk response cache
+    cache = ResponseCache('response_cache.sqlite')
+    # All agents share one connection pool and stay within the model's rate limits together
+    backend = RateLimitedBackend(OpenAIBackend(OPENAI_API_KEY), RateLimiter(requests_per_minute=200, tokens_per_minute=40000))
+    # Transient failures are retried, every retry waits for the rate limiter again
+    backend = ResilientBackend(backend, hedge_percentile=95)
+    # Latency, tokens and cost of every plan, step, expert query and code run
+    tracer = Tracer('trace.jsonl')
 
-    # Here we load the contract into the worker
-    worker.load_contract(contract_string)
-    results = worker.execute()
+    def create_worker(job):
+        # The journal lets an interrupted run resume where it stopped, one per contract entry
+        journal_path = f'conversation_journal_{job.id}.jsonl'
+        worker = SmartWorkerAgent(OPENAI_API_KEY, "gpt-4", backend=backend, cache=cache, journal=ConversationJournal(journal_path), tracer=tracer)
+        worker.restore_from_journal(journal_path)
+        return worker
 
-    # Here we just print the results, but in reality you might want to save them somewhere or use in another way
-    print("OUTPUTS:",results)
+    # Here we load every entry of the contract array into the scheduler
+    scheduler = ContractScheduler(create_worker, max_agents=4, budget_limits={"DOT": 100})
+    scheduler.submit(contract_string)
+    jobs = scheduler.run()
 
+    # Here we just print the results, but in reality you might want to save them somewhere or use in another way
+    for job in jobs:
+        print(f"OUTPUTS of contract {job.id} ({job.status}):", job.result if job.error is None else job.error)
+    print("SCHEDULER:", scheduler.stats())
+    print("CACHE:", cache.stats())
+    print("BACKEND:", backend.stats())
+    print("TRACE:", tracer.stats())
+    tracer.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,110 @@
+import json
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class BackendError(Exception):
+    """Raised when a backend answers with an error or an unreadable payload"""
+    def __init__(self, message: str, status_code: int = None, retry_after: float = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class Completion:
+    """Single chat completion returned by a backend"""
+    __slots__ = ('content', 'model', 'usage')
+
+    def __init__(self, content: str, model: str = None, usage: dict = None):
+        self.content = content
+        self.model = model
+        self.usage = usage or {}
+
+
+class LLMBackend:
+    """Transport used by SmartWorkerAgent to reach a chat completion model"""
+
+    def chat(self, messages: list[dict[str, str]], model: str, temperature: float) -> Completion:
+        raise NotImplementedError
+
+    def stream_chat(self, messages: list[dict[str, str]], model: str, temperature: float):
+        """Yield the content of the completion in chunks as they arrive"""
+        yield self.chat(messages, model, temperature).content
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class OpenAIBackend(LLMBackend):
+    """OpenAI compatible chat completions over a keep-alive pooled HTTP session.
+
+    The API key travels with the backend instead of the process-global openai.api_key,
+    so agents holding different backends can run side by side.
+    """
+
+    def __init__(self, api_key: str, api_base: str = "https://api.openai.com/v1", pool_size: int = 10, timeout: float = 600):
+        self.api_base = api_base.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({"Authorization": f"Bearer {api_key}"})
+
+    def chat(self, messages: list[dict[str, str]], model: str, temperature: float) -> Completion:
+        params = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+        }
+        response = self.session.post(f"{self.api_base}/chat/completions", json=params, timeout=self.timeout)
+        if response.status_code != 200:
+            raise self.error_for(response)
+
+        try:
+            data = response.json()
+            content = data["choices"][0]["message"]["content"]
+        except (ValueError, KeyError, IndexError) as e:
+            raise BackendError(f"Malformed chat completion response: {e}", response.status_code)
+        return Completion(content, data.get("model", model), data.get("usage"))
+
+    def stream_chat(self, messages: list[dict[str, str]], model: str, temperature: float):
+        params = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "stream": True,
+        }
+        with self.session.post(f"{self.api_base}/chat/completions", json=params, timeout=self.timeout, stream=True) as response:
+            if response.status_code != 200:
+                raise self.error_for(response)
+            # Server-sent events, one "data: {...}" line per chunk and "data: [DONE]" at the end
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    return
+                try:
+                    delta = json.loads(data)["choices"][0].get("delta", {})
+                except (ValueError, KeyError, IndexError) as e:
+                    raise BackendError(f"Malformed chat completion chunk: {e}", response.status_code)
+                if delta.get("content"):
+                    yield delta["content"]
+
+    def error_for(self, response: requests.Response) -> BackendError:
+        try:
+            retry_after = float(response.headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            retry_after = None
+        return BackendError(f"Chat completion failed with status {response.status_code}: {response.text}", response.status_code, retry_after)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+def cache_key(model: str, temperature: float, messages: list[dict[str, str]], namespace: str = None) -> str:
+    """Stable content hash of a chat request, requests of different namespaces never share a key"""
+    request = [model, temperature, messages] if namespace is None else [namespace, model, temperature, messages]
+    payload = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Content-addressed cache of model responses.
+
+    Responses live in an in-memory LRU bounded by entry count and total characters,
+    backed by an optional SQLite file that survives between runs. Entries evicted
+    from memory stay on disk and are promoted back on the next hit.
+    """
+
+    def __init__(self, path: str = None, max_entries: int = 1024, max_chars: int = 16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._chars = 0
+        self._lock = threading.Lock()
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, content TEXT NOT NULL)")
+            self._db.commit()
+
+    def get(self, key: str) -> str:
+        with self._lock:
+            content = self._entries.get(key)
+            if content is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return content
+
+            if self._db is not None:
+                row = self._db.execute("SELECT content FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self.hits += 1
+                    self.disk_hits += 1
+                    self._remember(key, row[0])
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, content: str):
+        with self._lock:
+            self._remember(key, content)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO responses (key, content) VALUES (?, ?)", (key, content))
+                self._db.commit()
+
+    def _remember(self, key: str, content: str):
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._chars -= len(previous)
+        if len(content) > self.max_chars:
+            return
+        self._entries[key] = content
+        self._chars += len(content)
+        while len(self._entries) > self.max_entries or self._chars > self.max_chars:
+            _, evicted = self._entries.popitem(last=False)
+            self._chars -= len(evicted)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "chars": self._chars,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._chars = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,188 @@
+import re
+
+
+class Command:
+    """Orchestrator command found in a model response"""
+    __slots__ = ('args', 'payload')
+    name = None
+
+    def __init__(self, args: tuple = (), payload: str = None):
+        self.args = tuple(args)
+        self.payload = payload
+
+    @property
+    def filename(self) -> str:
+        return self.args[0] if self.args else None
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.args == other.args and self.payload == other.payload
+
+    def __repr__(self):
+        payload = f", payload={len(self.payload)} chars" if self.payload is not None else ""
+        return f"{type(self).__name__}({self.args!r}{payload})"
+
+
+class ReturnContract(Command):
+    __slots__ = ()
+    name = "return_contract"
+
+
+class FinishContract(Command):
+    __slots__ = ()
+    name = "finish_contract"
+
+
+class WriteFile(Command):
+    __slots__ = ()
+    name = "write_file"
+
+    @property
+    def content(self) -> str:
+        return self.payload
+
+
+class DownloadFile(Command):
+    __slots__ = ()
+    name = "download_file"
+
+
+class RunCode(Command):
+    __slots__ = ()
+    name = "run_code"
+
+
+class ReadFile(Command):
+    __slots__ = ()
+    name = "read_file"
+
+
+COMMANDS = {command.name: command for command in (ReturnContract, FinishContract, WriteFile, DownloadFile, RunCode, ReadFile)}
+
+# Commands whose payload is the fenced block that follows them
+PAYLOAD_COMMANDS = (WriteFile, DownloadFile)
+
+COMMAND_PATTERN = re.compile(r"(?<![\w/])/(" + "|".join(COMMANDS) + r")\b")
+FENCE = "```"
+# Decoration models put around file names: `main.py`, [main.py], "main.py", main.py:
+FILENAME_STRIP = "`'\"[](),:;"
+
+
+class CommandParser:
+    """Single pass, incremental parser of orchestrator commands.
+
+    Feed the response as it arrives, every call returns the commands completed so far.
+    Commands are recognised outside of fenced blocks only, so code written through
+    /write_file never triggers other commands. /write_file and /download_file take
+    the rest of their line as content, or else the next fenced block.
+    """
+
+    def __init__(self):
+        self._partial = []  # chunks of the line not ended yet, joined once it ends
+        self._block = None  # lines of the fenced block being read
+        self._last_block = None
+        self._waiting = None  # payload command expecting a fenced block
+        self._waiting_fallback = None  # block written right before the waiting command
+        self._ready = []
+
+    def feed(self, chunk: str) -> list[Command]:
+        if "\n" not in chunk:
+            if chunk:
+                self._partial.append(chunk)
+            return []
+        self._partial.append(chunk)
+        lines = "".join(self._partial).split("\n")
+        rest = lines.pop()
+        self._partial = [rest] if rest else []
+        for line in lines:
+            self._line(line + "\n")
+        return self._take()
+
+    def close(self) -> list[Command]:
+        if self._partial:
+            self._line("".join(self._partial))
+            self._partial = []
+        if self._block is not None:
+            # An unterminated block still counts as the payload
+            self._end_block()
+        self._settle_waiting()
+        return self._take()
+
+    def _take(self) -> list[Command]:
+        ready, self._ready = self._ready, []
+        return ready
+
+    def _line(self, line: str):
+        if self._block is not None:
+            if line.lstrip().startswith(FENCE):
+                self._end_block()
+            else:
+                self._block.append(line)
+            return
+
+        if line.lstrip().startswith(FENCE):
+            self._block = []
+            return
+
+        if "/" not in line:
+            return
+        matches = list(COMMAND_PATTERN.finditer(line))
+        for index, match in enumerate(matches):
+            end = matches[index + 1].start() if index + 1 < len(matches) else len(line)
+            self._command(COMMANDS[match.group(1)], line[match.end():end])
+
+    def _command(self, command_type, rest: str):
+        self._settle_waiting()
+        block_before, self._last_block = self._last_block, None
+        filename, _, content = rest.strip().partition(" ")
+        filename = filename.strip(FILENAME_STRIP).rstrip(".")
+        args = [filename] if filename and command_type not in (ReturnContract, FinishContract) else []
+        if command_type not in PAYLOAD_COMMANDS:
+            self._ready.append(command_type(args))
+            return
+
+        if FENCE in content:
+            # Content opens a fenced block on the command line itself
+            opening = content.split(FENCE, 1)[1]
+            if FENCE in opening:
+                self._ready.append(command_type(args, opening.split(FENCE, 1)[0]))
+            else:
+                self._waiting = command_type(args)
+                self._block = []
+        elif content.strip():
+            self._ready.append(command_type(args, content.strip()))
+        else:
+            self._waiting = command_type(args)
+            self._waiting_fallback = block_before
+
+    def _end_block(self):
+        self._last_block = "".join(self._block)
+        self._block = None
+        if self._waiting is not None:
+            self._ready.append(type(self._waiting)(self._waiting.args, self._last_block))
+            self._waiting = None
+
+    def _settle_waiting(self):
+        """No block followed the waiting command, fall back to the block right before it"""
+        if self._waiting is not None:
+            self._ready.append(type(self._waiting)(self._waiting.args, self._waiting_fallback))
+            self._waiting = None
+
+
+def parse_commands(text: str) -> list[Command]:
+    parser = CommandParser()
+    return parser.feed(text) + parser.close()
+
+
+def iter_commands(chunks):
+    """Yield commands as soon as the chunks completing them arrive"""
+    parser = CommandParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+def first_command(commands: list[Command], *command_types) -> Command:
+    for command in commands:
+        if isinstance(command, command_types):
+            return command
+    return None
@@ -0,0 +1,181 @@
+import threading
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional, a character based estimate is used without it
+    tiktoken = None
+
+
+# Every chat message costs a few tokens of framing on top of its content
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 3
+
+
+class TokenCounter:
+    """Counts tokens of message contents, remembering the count of every content it has seen"""
+
+    def __init__(self, model: str = "gpt-4", max_cached: int = 65536):
+        self.max_cached = max_cached
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count_text(self, text: str) -> int:
+        count = self._counts.get(text)
+        if count is None:
+            if self._encoding is not None:
+                count = len(self._encoding.encode(text, disallowed_special=()))
+            else:
+                count = len(text) // 4 + 1
+            with self._lock:
+                if len(self._counts) >= self.max_cached:
+                    self._counts.clear()
+                self._counts[text] = count
+        return count
+
+    def count_message(self, message: dict[str, str]) -> int:
+        return MESSAGE_OVERHEAD_TOKENS + self.count_text(message["content"])
+
+    def count_messages(self, messages) -> int:
+        return REPLY_PRIMING_TOKENS + sum(self.count_message(message) for message in messages)
+
+
+def is_pinned(index: int, message: dict[str, str]) -> bool:
+    """The CompuLingo preamble and the contract (system) messages are never dropped"""
+    return index == 0 or message["role"] == "system"
+
+
+class SlidingWindowPolicy:
+    """Keeps the pinned messages and as many of the most recent messages as fit the budget"""
+
+    def __init__(self, pinned=is_pinned):
+        self.pinned = pinned
+
+    def fork(self) -> 'SlidingWindowPolicy':
+        return self
+
+    def select(self, messages: list, new_message: dict[str, str], budget: int, counter: TokenCounter) -> list:
+        pinned, recent, dropped = self.split(messages, new_message, budget, counter)
+        return self.merge(pinned, recent, new_message)
+
+    def split(self, messages: list, new_message: dict[str, str], budget: int, counter: TokenCounter) -> (list, list, list):
+        """Split (index, message) pairs into pinned, kept recent and dropped ones"""
+        pinned = []
+        others = []
+        for index, message in enumerate(messages):
+            (pinned if self.pinned(index, message) else others).append((index, message))
+
+        remaining = budget - REPLY_PRIMING_TOKENS - counter.count_message(new_message)
+        remaining -= sum(counter.count_message(message) for _, message in pinned)
+
+        cut = len(others)
+        while cut > 0:
+            cost = counter.count_message(others[cut - 1][1])
+            if cost > remaining:
+                break
+            remaining -= cost
+            cut -= 1
+        return pinned, others[cut:], others[:cut]
+
+    def merge(self, pinned: list, recent: list, new_message: dict[str, str], extra: list = ()) -> list:
+        """Rebuild the request in conversation order, extra messages take the place of the dropped turns"""
+        ordered = sorted(pinned + recent, key=lambda item: item[0])
+        messages = [message for _, message in ordered]
+        position = ordered.index(recent[0]) if recent else len(ordered)
+        return messages[:position] + list(extra) + messages[position:] + [new_message]
+
+
+def summarize_extractively(messages: list, max_chars: int = 2000) -> str:
+    """Default summarizer: the first sentence of every dropped message, within max_chars"""
+    lines = []
+    size = 0
+    for message in messages:
+        content = " ".join(str(message["content"]).split())
+        sentence = content.split(". ")[0][:300]
+        line = f"{message['role']}: {sentence}"
+        if size + len(line) > max_chars:
+            break
+        lines.append(line)
+        size += len(line) + 1
+    return "\n".join(lines)
+
+
+class RollingSummaryPolicy(SlidingWindowPolicy):
+    """Sliding window where the dropped turns are replaced by a summary message.
+
+    summarize receives the newly dropped messages and the previous summary (or None)
+    and returns the new summary, so older turns are folded into the summary only once.
+    """
+
+    def __init__(self, summarize=None, pinned=is_pinned, summary_budget: int = 512):
+        super().__init__(pinned)
+        self.summarize = summarize or (lambda dropped, previous: summarize_extractively(
+            ([{"role": "summary", "content": previous}] if previous else []) + dropped))
+        self.summary_budget = summary_budget
+        self._summarized = 0
+        self._summary = None
+
+    def fork(self) -> 'RollingSummaryPolicy':
+        return RollingSummaryPolicy(self.summarize, self.pinned, self.summary_budget)
+
+    def select(self, messages: list, new_message: dict[str, str], budget: int, counter: TokenCounter) -> list:
+        pinned, recent, dropped = self.split(messages, new_message, budget - self.summary_budget, counter)
+        if len(dropped) > self._summarized:
+            newly_dropped = [message for _, message in dropped[self._summarized:]]
+            self._summary = self.summarize(newly_dropped, self._summary)
+            self._summarized = len(dropped)
+
+        extra = []
+        if self._summary:
+            extra.append({"role": "system", "content": f"Summary of earlier conversation: {self._summary}"})
+        return self.merge(pinned, recent, new_message, extra)
+
+
+class ContextWindow:
+    """Keeps every request of an agent within a token budget"""
+
+    def __init__(self, max_tokens: int = 8192, reserve_tokens: int = 1024, policy: SlidingWindowPolicy = None, counter: TokenCounter = None):
+        self.max_tokens = max_tokens
+        self.reserve_tokens = reserve_tokens  # left for the completion
+        self.policy = policy or SlidingWindowPolicy()
+        self.counter = counter or TokenCounter()
+        self.requests = 0
+        self.tokens_sent = 0
+        self.tokens_saved = 0
+
+    @property
+    def budget(self) -> int:
+        return self.max_tokens - self.reserve_tokens
+
+    def fork(self) -> 'ContextWindow':
+        """Window with the same settings and token count cache, for another agent"""
+        return ContextWindow(self.max_tokens, self.reserve_tokens, self.policy.fork(), self.counter)
+
+    def build(self, messages, new_message: dict[str, str]) -> list:
+        """Messages to send for new_message, trimmed to the budget"""
+        request = list(messages)
+        request.append(new_message)
+        full_tokens = self.counter.count_messages(request)
+
+        if full_tokens > self.budget:
+            request = self.policy.select(request[:-1], new_message, self.budget, self.counter)
+            sent_tokens = self.counter.count_messages(request)
+        else:
+            sent_tokens = full_tokens
+
+        self.requests += 1
+        self.tokens_sent += sent_tokens
+        self.tokens_saved += full_tokens - sent_tokens
+        return request
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "tokens_sent": self.tokens_sent,
+            "tokens_saved": self.tokens_saved,
+        }
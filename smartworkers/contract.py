@@ -0,0 +1,236 @@
+"""Contracts compiled once into immutable, validated records.
+
+A contract entry is the JSON object of a contract array:
+    {"Action": {...}, "Validation": ..., "WorkerRequirements": {...}, "ValidatorRequirements": {...},
+     "ContractCompleteness": {...}, "Fail": ..., "Value": {"Budget": "10 DOT"}}
+
+Compiling checks it against the schema, computes a content hash stable across key order
+and whitespace, and renders its prompts once per template.
+"""
+import hashlib
+import json
+import re
+from functools import lru_cache
+
+
+BUDGET = re.compile(r"^\s*([0-9]+(?:\.[0-9]+)?)\s*([A-Za-z]*)\s*$")
+PERCENTAGE = re.compile(r"^\s*([0-9]+(?:\.[0-9]+)?)\s*%\s*$")
+
+
+class ContractError(ValueError):
+    """The contract does not match the contract schema"""
+
+
+class Record:
+    """Immutable record, fields are set once by the constructor"""
+    __slots__ = ()
+
+    def __init__(self, **fields):
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__ if not name.startswith('_'))
+        return f"{type(self).__name__}({fields})"
+
+
+class OutputColumn(Record):
+    __slots__ = ('name', 'description')
+
+
+class Action(Record):
+    __slots__ = ('prompt', 'output_columns', 'output_format', 'source_file_format', 'source_file')
+
+
+class Requirements(Record):
+    __slots__ = ('skills', 'certifications')
+
+
+class ContractCompleteness(Record):
+    """Acceptance criteria, with the accepted error and ambiguity percentages as ratios"""
+    __slots__ = ('acceptance_criteria', 'error_acceptance', 'ambiguity_acceptance')
+
+
+class Value(Record):
+    __slots__ = ('amount', 'currency')
+
+
+def _field(entry: dict, name: str, kind=str, required: bool = True, where: str = "contract"):
+    value = entry.get(name)
+    if value is None:
+        if required:
+            raise ContractError(f"{where} is missing {name}")
+        return None
+    if not isinstance(value, kind):
+        expected = " or ".join(option.__name__ for option in kind) if isinstance(kind, tuple) else kind.__name__
+        raise ContractError(f"{where}.{name} must be of type {expected}, got {type(value).__name__}")
+    return value
+
+
+def _ratio(entry: dict, name: str) -> float:
+    value = _field(entry, name, (str, int, float), required=False, where="ContractCompleteness")
+    if value is None:
+        return None
+    if isinstance(value, str):
+        match = PERCENTAGE.match(value)
+        if match is None:
+            raise ContractError(f"ContractCompleteness.{name} must be a percentage such as '5%', got {value!r}")
+        value = float(match.group(1))
+    if not 0 <= value <= 100:
+        raise ContractError(f"ContractCompleteness.{name} must be between 0% and 100%, got {value}")
+    return value / 100
+
+
+def compile_action(entry: dict) -> Action:
+    action = _field(entry, "Action", dict)
+    columns = _field(action, "OutputColumns", list, where="Action")
+    if not columns:
+        raise ContractError("Action.OutputColumns must not be empty")
+    output_columns = []
+    for index, column in enumerate(columns):
+        if not isinstance(column, dict):
+            raise ContractError(f"Action.OutputColumns[{index}] must be an object")
+        where = f"Action.OutputColumns[{index}]"
+        output_columns.append(OutputColumn(name=_field(column, "name", where=where), description=_field(column, "description", where=where)))
+    names = [column.name for column in output_columns]
+    if len(set(names)) != len(names):
+        raise ContractError(f"Action.OutputColumns has duplicate names: {names}")
+    return Action(
+        prompt=_field(action, "Prompt", where="Action"),
+        output_columns=tuple(output_columns),
+        output_format=_field(action, "OutputFormat", where="Action"),
+        source_file_format=_field(action, "SourceFileFormat", required=False, where="Action"),
+        source_file=_field(action, "SourceFile", required=False, where="Action"),
+    )
+
+
+def compile_requirements(entry: dict, name: str) -> Requirements:
+    requirements = _field(entry, name, dict, required=False) or {}
+    skills = _field(requirements, "Skills", list, required=False, where=name) or []
+    certifications = _field(requirements, "Certifications", list, required=False, where=name) or []
+    return Requirements(skills=tuple(map(str, skills)), certifications=tuple(map(str, certifications)))
+
+
+def compile_value(entry: dict) -> Value:
+    value = _field(entry, "Value", dict, required=False) or {}
+    budget = value.get("Budget")
+    if budget is None:
+        return Value(amount=0.0, currency=None)
+    match = BUDGET.match(str(budget))
+    if match is None:
+        raise ContractError(f"Value.Budget must be an amount with an optional currency such as '10 DOT', got {budget!r}")
+    return Value(amount=float(match.group(1)), currency=match.group(2) or None)
+
+
+def render_llm_prompt(contract: 'Contract') -> str:
+    action = contract.action
+    output_columns = ", ".join([f"{column.name} ({column.description})" for column in action.output_columns])
+    llm_prompt = f"{action.prompt} The output should be in {action.output_format} format and contain the following fields: {output_columns}. "
+    llm_prompt += f"Acceptance criteria: {contract.completeness.acceptance_criteria}."
+    if action.source_file is not None:
+        llm_prompt += f"PDF file is aviable in {action.source_file}."
+    return llm_prompt
+
+
+def render_system_message(contract: 'Contract') -> str:
+    return f"You are a helpful assistant. Your task is to understand and complete the given contract: {contract.render('llm')}"
+
+
+# Prompt templates of a contract, rendered at most once per contract
+TEMPLATES = {
+    "llm": render_llm_prompt,
+    "system": render_system_message,
+}
+
+
+class Contract(Record):
+    """One compiled contract entry.
+
+    hash is the sha256 of the canonical JSON of the entry, identical contracts have the
+    same hash whatever their key order or formatting. Rendered prompts are cached per
+    template name of TEMPLATES.
+    """
+    __slots__ = ('action', 'validation', 'worker_requirements', 'validator_requirements', 'completeness', 'fail', 'value',
+                 'source', 'hash', '_rendered')
+
+    def __init__(self, entry: dict):
+        if not isinstance(entry, dict):
+            raise ContractError(f"Contract entry must be an object, got {type(entry).__name__}")
+        action = compile_action(entry)
+        completeness = _field(entry, "ContractCompleteness", dict)
+        source = json.dumps(entry, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        super().__init__(
+            action=action,
+            validation=_field(entry, "Validation", required=False),
+            worker_requirements=compile_requirements(entry, "WorkerRequirements"),
+            validator_requirements=compile_requirements(entry, "ValidatorRequirements"),
+            completeness=ContractCompleteness(
+                acceptance_criteria=_field(completeness, "AcceptanceCriteria", where="ContractCompleteness"),
+                error_acceptance=_ratio(completeness, "ErrorAcceptance"),
+                ambiguity_acceptance=_ratio(completeness, "AmbiguityAcceptance"),
+            ),
+            fail=_field(entry, "Fail", required=False),
+            value=compile_value(entry),
+            source=source,
+            hash=hashlib.sha256(source.encode()).hexdigest(),
+            _rendered={},
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, Contract) and self.hash == other.hash
+
+    def __hash__(self):
+        return hash(self.hash)
+
+    def render(self, template: str = "llm") -> str:
+        rendered = self._rendered.get(template)
+        if rendered is None:
+            rendered = self._rendered[template] = TEMPLATES[template](self)
+        return rendered
+
+    def as_dict(self) -> dict:
+        return json.loads(self.source)
+
+    def to_json(self) -> str:
+        """The contract as a single entry contract array"""
+        return f"[{self.source}]"
+
+
+@lru_cache(maxsize=1024)
+def _compile_string(contract_string: str) -> tuple:
+    try:
+        entries = json.loads(contract_string)
+    except ValueError as e:
+        raise ContractError(f"Contract is not valid JSON: {e}") from e
+    if isinstance(entries, dict):
+        entries = [entries]
+    if not isinstance(entries, list):
+        raise ContractError("Contract must be an object or an array of objects")
+    return tuple(Contract(entry) for entry in entries)
+
+
+def compile_contracts(contract) -> list[Contract]:
+    """Compiled entries of a contract array, given as JSON, parsed JSON or compiled contracts.
+
+    JSON strings are compiled once, loading the same contract again reuses its records.
+    """
+    if isinstance(contract, Contract):
+        return [contract]
+    if isinstance(contract, str):
+        return list(_compile_string(contract))
+    if isinstance(contract, dict):
+        return [Contract(contract)]
+    if isinstance(contract, (list, tuple)):
+        return [entry if isinstance(entry, Contract) else Contract(entry) for entry in contract]
+    raise ContractError(f"Unsupported contract type {type(contract).__name__}")
+
+
+def compile_contract(contract) -> Contract:
+    """The single entry of a contract, a contract array with several entries is an error"""
+    contracts = compile_contracts(contract)
+    if len(contracts) != 1:
+        raise ContractError(f"Expected one contract entry, got {len(contracts)}, submit arrays to the ContractScheduler")
+    return contracts[0]
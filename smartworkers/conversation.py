@@ -0,0 +1,102 @@
+from itertools import islice
+
+
+class Message:
+    """Immutable chat message record"""
+    __slots__ = ('role', 'content')
+
+    def __init__(self, role: str, content: str):
+        object.__setattr__(self, 'role', role)
+        object.__setattr__(self, 'content', content)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Message is immutable")
+
+    def __getitem__(self, key: str) -> str:
+        # Lets records stand in for the {"role": ..., "content": ...} dicts used everywhere else
+        if key == 'role':
+            return self.role
+        if key == 'content':
+            return self.content
+        raise KeyError(key)
+
+    def __repr__(self):
+        return f"Message({self.role!r}, {self.content[:40]!r})"
+
+    def as_dict(self) -> dict[str, str]:
+        return {"role": self.role, "content": self.content}
+
+    @classmethod
+    def of(cls, message) -> 'Message':
+        return message if isinstance(message, cls) else cls(message["role"], message["content"])
+
+
+class Conversation:
+    """Branch of a conversation tree with copy-on-write message storage.
+
+    A fork shares the message records of its parent and copies the list of references
+    only when it appends for the first time, so experts forked from the same prefix keep
+    a single copy of it. parent links the branch to the conversation it was forked from.
+    The API dicts of the messages are built once on append and shared the same way.
+    """
+    __slots__ = ('parent', '_log', '_dicts', '_length', '_owns_log')
+
+    def __init__(self, messages=(), parent: 'Conversation' = None):
+        self.parent = parent
+        self._log = [Message.of(message) for message in messages]
+        self._dicts = [message.as_dict() for message in self._log]
+        self._length = len(self._log)
+        self._owns_log = True
+
+    def fork(self) -> 'Conversation':
+        branch = Conversation(parent=self)
+        branch._log = self._log
+        branch._dicts = self._dicts
+        branch._length = self._length
+        branch._owns_log = False
+        return branch
+
+    def freeze(self) -> 'Conversation':
+        """Stop appending in place, later appends copy the references first"""
+        self._owns_log = False
+        return self
+
+    def append(self, message):
+        if not self._owns_log or len(self._log) != self._length:
+            self._log = self._log[:self._length]
+            self._dicts = self._dicts[:self._length]
+            self._owns_log = True
+        message = Message.of(message)
+        self._log.append(message)
+        self._dicts.append(message.as_dict())
+        self._length += 1
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self):
+        return islice(self._log, self._length)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._log[:self._length][index]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("conversation index out of range")
+        return self._log[index]
+
+    def __add__(self, other: list) -> list:
+        return self._dicts[:self._length] + list(other)
+
+    def as_dicts(self) -> list[dict[str, str]]:
+        """Messages in the shape expected by the chat completion API.
+
+        The list is new, the dicts are shared with the conversation and its forks and
+        must not be modified.
+        """
+        return self._dicts[:self._length]
@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:  # not available on Windows, only the wall-clock timeout applies there
+    resource = None
+
+
+# Runs inside the child process: applies the limits, then runs the file as __main__
+LAUNCHER = """
+import os, resource, runpy, sys
+cpu_seconds, memory_bytes = int(sys.argv[1]), int(sys.argv[2])
+if cpu_seconds:
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+if memory_bytes:
+    resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+sys.argv = sys.argv[3:]
+# As with "python file.py", imports resolve next to the file first
+sys.path[0] = os.path.dirname(os.path.abspath(sys.argv[0]))
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+
+class ExecutionResult:
+    """Outcome of running a file"""
+    __slots__ = ('returncode', 'stdout', 'stderr', 'timed_out', 'duration', 'cached')
+
+    def __init__(self, returncode: int, stdout: str, stderr: str, timed_out: bool, duration: float, cached: bool = False):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.timed_out = timed_out
+        self.duration = duration
+        self.cached = cached
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.timed_out
+
+    def as_cached(self) -> 'ExecutionResult':
+        return ExecutionResult(self.returncode, self.stdout, self.stderr, self.timed_out, self.duration, True)
+
+
+class CodeExecutor:
+    """Runs files written by the agents in separate, resource limited Python processes.
+
+    At most max_workers processes run at once. Every run is bounded by a wall-clock
+    timeout and, where the resource module exists, by CPU time and address space limits.
+    Results are cached by the file content and arguments, and concurrent requests for the
+    same run share a single process.
+    """
+
+    def __init__(self, max_workers: int = 2, timeout: float = 60, cpu_seconds: int = 60, memory_bytes: int = 1024 * 1024 * 1024,
+                 cache_size: int = 128, max_output_chars: int = 1024 * 1024, python: str = sys.executable):
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+        self.cache_size = cache_size
+        self.max_output_chars = max_output_chars
+        self.python = python
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="code-executor")
+        self._results = OrderedDict()
+        self._running = {}
+        self._lock = threading.RLock()  # done callbacks may run inside submit()
+
+    def cache_key(self, filename: str, args: tuple = ()) -> str:
+        digest = hashlib.sha256()
+        with open(filename, 'rb') as file:
+            for block in iter(lambda: file.read(65536), b''):
+                digest.update(block)
+        digest.update(json.dumps([os.path.abspath(filename), list(args)]).encode())
+        return digest.hexdigest()
+
+    def submit(self, filename: str, args: tuple = (), on_output=None) -> Future:
+        """Schedule a run, on_output(stream_name, line) is called as the output arrives"""
+        key = self.cache_key(filename, args)
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+                future = Future()
+                future.set_result(result.as_cached())
+                return future
+            future = self._running.get(key)
+            if future is None:
+                future = self._pool.submit(self._execute, filename, tuple(args), on_output)
+                self._running[key] = future
+                future.add_done_callback(lambda done: self._remember(key, done))
+            return future
+
+    def run(self, filename: str, args: tuple = (), on_output=None) -> ExecutionResult:
+        return self.submit(filename, args, on_output).result()
+
+    async def run_async(self, filename: str, args: tuple = (), on_output=None) -> ExecutionResult:
+        return await asyncio.wrap_future(self.submit(filename, args, on_output))
+
+    def _remember(self, key: str, future: Future):
+        with self._lock:
+            self._running.pop(key, None)
+            if future.cancelled() or future.exception() is not None:
+                return
+            self._results[key] = future.result()
+            while len(self._results) > self.cache_size:
+                self._results.popitem(last=False)
+
+    def _command(self, filename: str, args: tuple) -> list[str]:
+        if resource is None:
+            return [self.python, filename, *args]
+        return [self.python, "-c", LAUNCHER, str(self.cpu_seconds or 0), str(self.memory_bytes or 0), filename, *args]
+
+    def _execute(self, filename: str, args: tuple, on_output) -> ExecutionResult:
+        start = time.monotonic()
+        process = subprocess.Popen(self._command(filename, args), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   text=True, errors='replace', start_new_session=resource is not None)
+        outputs = {"stdout": [], "stderr": []}
+        readers = [threading.Thread(target=self._read, args=(stream, name, outputs[name], on_output), daemon=True)
+                   for name, stream in (("stdout", process.stdout), ("stderr", process.stderr))]
+        for reader in readers:
+            reader.start()
+
+        timed_out = False
+        try:
+            process.wait(self.timeout)
+        except subprocess.TimeoutExpired:
+            timed_out = True
+            logging.warning(f"Execution of {filename} timed out after {self.timeout}s")
+            self._kill(process)
+            process.wait()
+        for reader in readers:
+            reader.join()
+
+        return ExecutionResult(process.returncode, "".join(outputs["stdout"]), "".join(outputs["stderr"]),
+                               timed_out, time.monotonic() - start)
+
+    def _read(self, stream, name: str, chunks: list, on_output):
+        size = 0
+        for line in stream:
+            if on_output is not None:
+                on_output(name, line)
+            if size < self.max_output_chars:
+                chunks.append(line[:self.max_output_chars - size])
+                size += len(line)
+        stream.close()
+
+    def _kill(self, process: subprocess.Popen):
+        if resource is not None:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+                return
+            except ProcessLookupError:
+                return
+        process.kill()
+
+    def clear_cache(self):
+        with self._lock:
+            self._results.clear()
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
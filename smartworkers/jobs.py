@@ -0,0 +1,232 @@
+import json
+import logging
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED = (DONE, FAILED)
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+class JobStore:
+    """Persistent record of the jobs, kept in a local SQLite file.
+
+    A running job belongs to the queue that claimed it (owner), which renews its lease
+    (heartbeat) while the job runs. Processes sharing the file only requeue running jobs
+    whose lease expired, their owner is gone.
+    """
+
+    COLUMNS = ("id", "status", "filepath", "params", "progress", "message", "result", "error", "owner", "heartbeat", "created", "updated")
+
+    def __init__(self, path: str):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY, status TEXT NOT NULL, filepath TEXT NOT NULL, params TEXT,
+                progress REAL DEFAULT 0, message TEXT, result TEXT, error TEXT, owner TEXT, heartbeat REAL,
+                created REAL NOT NULL, updated REAL NOT NULL)""")
+            # Job files created before jobs had owners
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+            for column, column_type in (("owner", "TEXT"), ("heartbeat", "REAL")):
+                if column not in columns:
+                    self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+            self._db.commit()
+
+    def create(self, filepath: str, params: dict) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT INTO jobs (id, status, filepath, params, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                             (job_id, QUEUED, filepath, json.dumps(params), now, now))
+            self._db.commit()
+        return job_id
+
+    def update(self, job_id: str, **fields):
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        fields["updated"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            self._db.commit()
+
+    def claim(self, job_id: str, owner: str) -> bool:
+        """Mark a queued job as running for owner, False if it is gone or another worker claimed it first"""
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute("UPDATE jobs SET status = ?, owner = ?, heartbeat = ?, progress = 0, message = 'started', updated = ? "
+                                      "WHERE id = ? AND status = ?", (RUNNING, owner, now, now, job_id, QUEUED))
+            self._db.commit()
+        return cursor.rowcount == 1
+
+    def heartbeat(self, owner: str):
+        """Renew the lease of every job owner is running"""
+        with self._lock:
+            self._db.execute("UPDATE jobs SET heartbeat = ? WHERE owner = ? AND status = ?", (time.time(), owner, RUNNING))
+            self._db.commit()
+
+    def get(self, job_id: str) -> dict:
+        with self._lock:
+            row = self._db.execute(f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(self.COLUMNS, row))
+        job["params"] = json.loads(job["params"]) if job["params"] else {}
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def queued(self) -> list[str]:
+        with self._lock:
+            rows = self._db.execute("SELECT id FROM jobs WHERE status = ? ORDER BY created", (QUEUED,)).fetchall()
+        return [row[0] for row in rows]
+
+    def requeue_stale(self, lease: float) -> list[str]:
+        """Queue again the running jobs whose lease expired, returns their ids"""
+        expired = time.time() - lease
+        requeued = []
+        with self._lock:
+            # Jobs of files without heartbeats fall back to their last update
+            rows = self._db.execute("SELECT id FROM jobs WHERE status = ? AND COALESCE(heartbeat, updated) < ? ORDER BY created",
+                                    (RUNNING, expired)).fetchall()
+            for (job_id,) in rows:
+                # Conditional, so of several processes finding the same stale job only one requeues it
+                cursor = self._db.execute("UPDATE jobs SET status = ?, owner = NULL, updated = ? WHERE id = ? AND status = ? AND COALESCE(heartbeat, updated) < ?",
+                                          (QUEUED, time.time(), job_id, RUNNING, expired))
+                if cursor.rowcount == 1:
+                    requeued.append(job_id)
+            self._db.commit()
+        return requeued
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class JobQueue:
+    """Bounded queue of jobs processed by a pool of worker threads.
+
+    handler(filepath, params, progress) does the work and returns a JSON serializable
+    result, progress(fraction, message) reports how far it got. Several processes may
+    share the store: a worker claims a job atomically, and every queue renews the lease of
+    its running jobs every lease / 4 seconds. On start() and on every renewal, running jobs
+    whose lease expired, left by a process that died, are queued again. Change versions
+    are kept for the last max_finished_versions finished jobs only.
+    """
+
+    max_finished_versions = 1000
+    lease = 60.0
+
+    def __init__(self, store: JobStore, handler, max_workers: int = 2, max_pending: int = 16):
+        self.store = store
+        self.handler = handler
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._queue = queue.Queue()
+        self._pending = 0
+        self._versions = {}
+        self._finished = deque()
+        self._changed = threading.Condition()
+        self._workers = []
+        # Unique per queue, a restarted process may get the pid of a dead one
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def start(self) -> 'JobQueue':
+        if self._workers:
+            return self
+        for job_id in self.store.requeue_stale(self.lease):
+            logging.info(f"Requeueing job {job_id}, its lease expired")
+        # Queued jobs of other processes as well, the claim decides who runs them
+        for job_id in self.store.queued():
+            self._enqueue(job_id)
+        for index in range(self.max_workers):
+            worker = threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        threading.Thread(target=self._renew, name="job-lease", daemon=True).start()
+        return self
+
+    def _renew(self):
+        while True:
+            time.sleep(self.lease / 4)
+            try:
+                self.store.heartbeat(self.owner)
+                for job_id in self.store.requeue_stale(self.lease):
+                    logging.info(f"Requeueing job {job_id}, its lease expired")
+                    self._enqueue(job_id)
+            except Exception:
+                logging.exception("Renewing the job leases failed")
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def submit(self, filepath: str, params: dict = None) -> str:
+        with self._changed:
+            if self._pending >= self.max_pending:
+                raise QueueFull(f"{self._pending} jobs are already waiting")
+            self._pending += 1
+        job_id = self.store.create(filepath, params or {})
+        self._queue.put(job_id)
+        return job_id
+
+    def _enqueue(self, job_id: str):
+        with self._changed:
+            self._pending += 1
+        self._queue.put(job_id)
+
+    def _notify(self, job_id: str, finished: bool = False):
+        with self._changed:
+            self._versions[job_id] = self._versions.get(job_id, 0) + 1
+            if finished:
+                # Waiters of a job finished long ago have returned, its version is no longer needed
+                self._finished.append(job_id)
+                while len(self._finished) > self.max_finished_versions:
+                    self._versions.pop(self._finished.popleft(), None)
+            self._changed.notify_all()
+
+    def version(self, job_id: str) -> int:
+        with self._changed:
+            return self._versions.get(job_id, 0)
+
+    def wait_for_change(self, job_id: str, version: int, timeout: float = 15) -> int:
+        """Block until the job changes after the given version, returns the current version"""
+        with self._changed:
+            self._changed.wait_for(lambda: self._versions.get(job_id, 0) != version, timeout)
+            return self._versions.get(job_id, 0)
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            with self._changed:
+                self._pending -= 1
+            # The claim is atomic, a job queued twice (or by another process) runs once
+            if not self.store.claim(job_id, self.owner):
+                continue
+            job = self.store.get(job_id)
+            self._notify(job_id)
+
+            def progress(fraction: float, message: str = None):
+                self.store.update(job_id, progress=fraction, message=message)
+                self._notify(job_id)
+
+            try:
+                result = self.handler(job["filepath"], job["params"], progress)
+                self.store.update(job_id, status=DONE, progress=1.0, message="finished", result=result)
+            except Exception as e:
+                logging.exception(f"Job {job_id} failed")
+                self.store.update(job_id, status=FAILED, error=str(e))
+            self._notify(job_id, finished=True)
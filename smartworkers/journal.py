@@ -0,0 +1,164 @@
+"""Append-only JSONL journal of an agent's conversation.
+
+Every record is one JSON object per line:
+    {"type": "message", "message": {"role": ..., "content": ...}}
+    {"type": "memory", "item": ...}
+    {"type": "contract", "hash": ...}
+    {"type": "plan", "plan": [...]}
+    {"type": "step", "position": ..., "proposed": [...]}
+    {"type": "snapshot", "messages": [...], "memory": [...], "plan": [...], "position": ..., "past_responses": [...], "contracts": [...]}
+
+Compact the journals of agents that are not running with:
+    python -m smartworkers.journal compact conversation.jsonl [more.jsonl ...]
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+
+
+class ConversationJournal:
+    """Buffered append-only journal, flushed and fsynced in batches"""
+
+    def __init__(self, path: str, batch_size: int = 32, flush_interval: float = 1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.bytes_written = 0
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def path_for(self, name: str) -> str:
+        """Path of a sibling journal, used for the experts of an agent"""
+        root, ext = os.path.splitext(self.path)
+        return f"{root}.{name}{ext or '.jsonl'}"
+
+    def append(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            self._buffer.append(line)
+            if len(self._buffer) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        self._last_flush = time.monotonic()
+        if not self._buffer or self._file is None:
+            return
+        data = "".join(self._buffer)
+        self._buffer.clear()
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.bytes_written += len(data)
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class JournalState:
+    """Agent state rebuilt from a journal"""
+
+    def __init__(self):
+        self.messages = []
+        self.memory = []
+        self.plan = None
+        self.position = 0
+        self.past_responses = []
+        self.contracts = []  # hashes of the contracts whose system message is in messages
+
+    def apply(self, record: dict):
+        kind = record.get("type")
+        if kind == "message":
+            self.messages.append(record["message"])
+        elif kind == "memory":
+            self.memory.append(record["item"])
+        elif kind == "contract":
+            self.contracts.append(record["hash"])
+        elif kind == "plan":
+            self.plan = record["plan"]
+            self.position = 0
+        elif kind == "step":
+            self.position = record["position"]
+            self.past_responses.extend(record.get("proposed", []))
+        elif kind == "snapshot":
+            self.messages = list(record["messages"])
+            self.memory = list(record["memory"])
+            self.plan = record["plan"]
+            self.position = record["position"]
+            self.past_responses = list(record["past_responses"])
+            self.contracts = list(record.get("contracts", []))
+        else:
+            logging.warning(f"Unknown journal record type: {kind}")
+
+    def snapshot(self) -> dict:
+        return {
+            "type": "snapshot",
+            "messages": self.messages,
+            "memory": self.memory,
+            "plan": self.plan,
+            "position": self.position,
+            "past_responses": list(dict.fromkeys(self.past_responses)),
+            "contracts": list(dict.fromkeys(self.contracts)),
+        }
+
+
+def read_journal(path: str):
+    """Yield the records of a journal, ignoring a torn last line left by a crash"""
+    with open(path, encoding='utf-8') as file:
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                logging.warning(f"Skipping unreadable journal line {number} in {path}")
+
+
+def replay_journal(path: str) -> JournalState:
+    state = JournalState()
+    if os.path.exists(path):
+        for record in read_journal(path):
+            state.apply(record)
+    return state
+
+
+def compact_journal(path: str) -> int:
+    """Replace the journal by a single snapshot record, returns the number of bytes saved"""
+    before = os.path.getsize(path)
+    state = replay_journal(path)
+    tmp_path = path + ".compact"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        file.write(json.dumps(state.snapshot(), ensure_ascii=False, default=str) + "\n")
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    return before - os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintenance of SmartWorker conversation journals")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    compact = subparsers.add_parser("compact", help="Rewrite journals as a single snapshot record")
+    compact.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "compact":
+        for path in args.paths:
+            saved = compact_journal(path)
+            print(f"{path}: compacted, {saved} bytes saved")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+import hashlib
+import json
+import logging
+import mmap
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # pypdf is only needed by the PDF worker
+    PdfReader = None
+
+from smartworkers.backends import LLMBackend
+from smartworkers.cache import ResponseCache
+from smartworkers.context import TokenCounter
+from smartworkers.executor import CodeExecutor
+from smartworkers.smartworker import SmartWorkerAgent
+from smartworkers.tracing import Tracer, propagate
+from smartworkers import validator
+
+
+DEFAULT_PROMPT = "Extract the structured data contained in the document."
+JSON_ARRAY = re.compile(r"\[.*\]", re.DOTALL)
+DOUBLE_EXTRACTION = re.compile(r"double[ -]extract", re.IGNORECASE)
+
+
+def document_hash(path: str) -> str:
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return hashlib.sha256(data).hexdigest()
+
+
+def extract_pages(path: str, pages: list[int]) -> list[str]:
+    """Text of the given pages, runs in a worker process on a memory map of the file"""
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        reader = PdfReader(data)
+        return [reader.pages[page].extract_text() or "" for page in pages]
+
+
+def count_pages(path: str) -> int:
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return len(PdfReader(data).pages)
+
+
+class Chunk:
+    """Consecutive pages, or a section of one large page, sent to the model as one task"""
+    __slots__ = ('first_page', 'last_page', 'section', 'text')
+
+    def __init__(self, first_page: int, last_page: int, text: str, section: int = 0):
+        self.first_page = first_page
+        self.last_page = last_page
+        self.section = section
+        self.text = text
+
+    @property
+    def page_range(self) -> str:
+        return f"{self.first_page + 1}-{self.last_page + 1}#{self.section}"
+
+
+class PdfSmartWorker(SmartWorkerAgent):
+    """Extracts the data a contract asks for from a PDF, chunk by chunk.
+
+    Page text is extracted in a process pool and cached per (document hash, page).
+    Pages are grouped into chunks that fit chunk_tokens, and every chunk is an
+    independent model request. Chunk results are cached per (chunk text hash, page
+    range, contract hash), so an amended document or contract only reprocesses the
+    chunks whose text or instructions changed.
+
+    With double_extraction every chunk is extracted twice by independent requests and
+    the Validator compares both runs, by default when the Validation of the contract
+    asks for it. Rows are validated against the contract whenever numpy is available.
+
+    A long-running process passes one backend, chunk_cache and code_executor to all its
+    workers. Those a worker creates itself are released by close().
+    """
+
+    def __init__(self, contract, gpt_api_key: str = None, gpt_model: str = "gpt-4", backend: LLMBackend = None,
+                 cache_path: str = None, chunk_tokens: int = 3000, pages_per_task: int = 8,
+                 max_processes: int = None, max_concurrent_chunks: int = 4, double_extraction: bool = None, tracer: Tracer = None,
+                 chunk_cache: ResponseCache = None, code_executor: CodeExecutor = None):
+        if PdfReader is None:
+            raise RuntimeError("pypdf is required to process PDF files")
+        super().__init__(gpt_api_key or os.getenv("OPENAI_API_KEY"), gpt_model, backend=backend, code_executor=code_executor, tracer=tracer)
+        # Resources created here rather than passed in, released by close()
+        self._owned = []
+        if backend is None:
+            self._owned.append(self.backend.close)
+        if code_executor is None:
+            self._owned.append(self.code_executor.shutdown)
+        self.load_contract(contract)
+        self.chunk_tokens = chunk_tokens
+        self.pages_per_task = pages_per_task
+        self.max_processes = max_processes
+        self.max_concurrent_chunks = max_concurrent_chunks
+        if double_extraction is None:
+            double_extraction = self.contract is not None and DOUBLE_EXTRACTION.search(self.contract.validation or "") is not None
+        self.double_extraction = double_extraction
+        self.counter = TokenCounter(gpt_model)
+        # Page texts and chunk results share one store, their keys never collide
+        if chunk_cache is None:
+            chunk_cache = ResponseCache(cache_path, max_entries=4096)
+            self._owned.append(chunk_cache.close)
+        self.chunk_cache = chunk_cache
+
+    def close(self):
+        for close in self._owned:
+            close()
+        self._owned = []
+
+    def extraction_prompt(self) -> str:
+        return self.contract.render("llm") if self.contract is not None else DEFAULT_PROMPT
+
+    def page_texts(self, path: str, doc_hash: str, progress=None) -> list[str]:
+        """Text of every page, extracting only the pages missing from the cache"""
+        with self.tracer.span("pages") as span:
+            total = count_pages(path)
+            texts = [self.chunk_cache.get(f"page:{doc_hash}:{page}") for page in range(total)]
+            missing = [page for page, text in enumerate(texts) if text is None]
+            span.set(pages=total, extracted=len(missing))
+
+            if missing:
+                batches = [missing[start:start + self.pages_per_task] for start in range(0, len(missing), self.pages_per_task)]
+                # Forked children would inherit the locks of the job and model threads of this process
+                with ProcessPoolExecutor(max_workers=self.max_processes, mp_context=multiprocessing.get_context('spawn')) as pool:
+                    for done, (batch, extracted) in enumerate(zip(batches, pool.map(extract_pages, [path] * len(batches), batches)), 1):
+                        for page, text in zip(batch, extracted):
+                            texts[page] = text
+                            self.chunk_cache.put(f"page:{doc_hash}:{page}", text)
+                        if progress is not None:
+                            progress(0.3 * done / len(batches), f"Extracted text of {min(done * self.pages_per_task, len(missing))}/{len(missing)} pages")
+        logging.info(f"Extracted {len(missing)} of {total} pages of {path}, {total - len(missing)} from cache")
+        return texts
+
+    def split_chunks(self, texts: list[str]) -> list[Chunk]:
+        """Group consecutive pages up to the token budget, pages above it are split into sections.
+
+        Pages and sections without text, such as scanned images, are left out, so they never
+        cost a model request.
+        """
+        chunks = []
+        first, last, parts, tokens = None, None, [], 0
+        for page, text in enumerate(texts):
+            if not text.strip():
+                continue
+            page_tokens = self.counter.count_text(text)
+            if parts and tokens + page_tokens > self.chunk_tokens:
+                chunks.append(Chunk(first, last, "\n".join(parts)))
+                first, parts, tokens = None, [], 0
+
+            if page_tokens > self.chunk_tokens:
+                for section, section_text in enumerate(self.split_sections(text)):
+                    if section_text.strip():
+                        chunks.append(Chunk(page, page, section_text, section))
+                continue
+
+            first = page if first is None else first
+            last = page
+            parts.append(f"[Page {page + 1}]\n{text}")
+            tokens += page_tokens
+        if parts:
+            chunks.append(Chunk(first, last, "\n".join(parts)))
+        return chunks
+
+    def split_sections(self, text: str) -> list[str]:
+        sections, current, tokens = [], [], 0
+        for paragraph in text.split("\n"):
+            paragraph_tokens = self.counter.count_text(paragraph)
+            if current and tokens + paragraph_tokens > self.chunk_tokens:
+                sections.append("\n".join(current))
+                current, tokens = [], 0
+            current.append(paragraph)
+            tokens += paragraph_tokens
+        if current:
+            sections.append("\n".join(current))
+        return sections
+
+    def process_chunk(self, chunk: Chunk, prompt: str, contract_hash: str, run: int = 0) -> (list, bool):
+        """Rows extracted from one chunk and whether they came from the cache, every run is cached separately"""
+        text_hash = hashlib.sha256(chunk.text.encode()).hexdigest()
+        key = f"chunk:{text_hash}:{chunk.page_range}:{contract_hash}" + (f":run{run}" if run else "")
+        with self.tracer.span("chunk", pages=chunk.page_range, run=run) as span:
+            cached = self.chunk_cache.get(key)
+            span.set(cached=cached is not None)
+            if cached is not None:
+                return json.loads(cached), True
+
+            messages = [
+                {"role": "system", "content": f"{prompt} Answer only with a JSON array of objects, one per extracted record, and an empty array if the excerpt has none."},
+                {"role": "user", "content": f"Excerpt of pages {chunk.first_page + 1}-{chunk.last_page + 1}:\n{chunk.text}"},
+            ]
+            completion = self.backend.chat(messages, self.gpt_model, 0.1)
+            self.tracer.record_completion(self.gpt_model, messages, completion)
+            rows = self.parse_rows(completion.content)
+            for row in rows:
+                row.setdefault("source_pages", f"{chunk.first_page + 1}-{chunk.last_page + 1}")
+            span.set(rows=len(rows))
+        self.chunk_cache.put(key, json.dumps(rows))
+        return rows, False
+
+    def parse_rows(self, response: str) -> list[dict]:
+        match = JSON_ARRAY.search(response)
+        if match is None:
+            logging.warning(f"No JSON array in chunk response: {response[:200]}")
+            return []
+        try:
+            rows = json.loads(match.group(0))
+        except ValueError as e:
+            logging.warning(f"Invalid JSON in chunk response: {e}")
+            return []
+        return [row for row in rows if isinstance(row, dict)]
+
+    def process_pdf(self, filepath: str, progress=None) -> dict:
+        with self.tracer.span("pdf") as span:
+            result = self._process_pdf(filepath, progress)
+            span.set(document=result["document"], pages=result["pages"], chunks=result["chunks"], cached_chunks=result["cached_chunks"])
+        return result
+
+    def _process_pdf(self, filepath: str, progress=None) -> dict:
+        prompt = self.extraction_prompt()
+        contract_hash = hashlib.sha256(prompt.encode()).hexdigest()
+        doc_hash = document_hash(filepath)
+
+        texts = self.page_texts(filepath, doc_hash, progress)
+        chunks = self.split_chunks(texts)
+
+        runs = 2 if self.double_extraction else 1
+        tasks = [(chunk, run) for run in range(runs) for chunk in chunks]
+        rows, second_rows, cached_chunks = [], [], 0
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_chunks) as pool:
+            # Chunk spans started on the pool threads are children of the pdf span
+            futures = [pool.submit(propagate(self.process_chunk), chunk, prompt, contract_hash, run) for chunk, run in tasks]
+            results = (future.result() for future in futures)
+            for done, ((chunk, run), (chunk_rows, cached)) in enumerate(zip(tasks, results), 1):
+                (second_rows if run else rows).extend(chunk_rows)
+                cached_chunks += cached
+                if progress is not None:
+                    progress(0.3 + 0.7 * done / len(tasks), f"Processed {done}/{len(tasks)} chunk extractions")
+
+        return {
+            "document": doc_hash,
+            "pages": len(texts),
+            "chunks": len(chunks),
+            "cached_chunks": cached_chunks,
+            "rows": rows,
+            "validation": self.validate_rows(rows, second_rows if self.double_extraction else None),
+        }
+
+    def validate_rows(self, rows: list[dict], second_run: list[dict] = None) -> dict:
+        """Validation report of the extracted rows, None without a contract or numpy"""
+        if self.contract is None:
+            return None
+        if validator.np is None:
+            logging.warning("numpy is not installed, extracted rows are not validated")
+            return None
+        with self.tracer.span("validate", rows=len(rows)) as span:
+            report = validator.Validator(self.contract).validate(rows, second_run)
+            span.set(passed=report.passed)
+        return report.as_dict()
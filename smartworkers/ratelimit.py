@@ -0,0 +1,86 @@
+import threading
+import time
+
+from smartworkers.backends import Completion, LLMBackend
+from smartworkers.context import TokenCounter
+
+
+class TokenBucket:
+    """Refills rate_per_minute units per minute up to capacity, shared by all threads"""
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float = 1):
+        """Block until amount units are available and take them"""
+        # Requests larger than the bucket would never fit, they wait for a full bucket instead
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._level >= amount:
+                    self._level -= amount
+                    return
+                wait = (amount - self._level) / self.rate
+            time.sleep(wait)
+
+    def consume(self, amount: float):
+        """Take units without waiting, the level may go below zero and delay later requests"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._level -= amount
+
+
+class RateLimiter:
+    """Requests and tokens per minute limits of a model backend"""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    def acquire(self, tokens: int):
+        self.requests.acquire(1)
+        self.tokens.acquire(tokens)
+
+
+class RateLimitedBackend(LLMBackend):
+    """Waits for the shared rate limiter before every request of the wrapped backend.
+
+    A request reserves its prompt tokens plus completion_tokens, the difference with
+    the usage reported by the backend is settled once the response arrives.
+    """
+
+    def __init__(self, backend: LLMBackend, limiter: RateLimiter, counter: TokenCounter = None, completion_tokens: int = 500):
+        self.backend = backend
+        self.limiter = limiter
+        self.counter = counter or TokenCounter()
+        self.completion_tokens = completion_tokens
+
+    def reserve(self, messages: list[dict[str, str]]) -> int:
+        tokens = self.counter.count_messages(messages) + self.completion_tokens
+        self.limiter.acquire(tokens)
+        return tokens
+
+    def chat(self, messages: list[dict[str, str]], model: str, temperature: float) -> Completion:
+        reserved = self.reserve(messages)
+        completion = self.backend.chat(messages, model, temperature)
+        used = completion.usage.get("total_tokens")
+        if used:
+            self.limiter.tokens.consume(used - reserved)
+        return completion
+
+    def stream_chat(self, messages: list[dict[str, str]], model: str, temperature: float):
+        self.reserve(messages)
+        yield from self.backend.stream_chat(messages, model, temperature)
+
+    def close(self):
+        self.backend.close()
@@ -0,0 +1,178 @@
+"""Scripted, recorded and replayed model backends for offline runs of the agent loop.
+
+A transcript is a JSONL file, an optional header followed by one line per response:
+    {"type": "header", ...}
+    {"type": "response", "key": ..., "content": ..., "model": ..., "usage": {...}, "latency": 0.42}
+
+key is cache_key() of the request, so a replayed agent gets the recorded answer to
+every request it makes again, and a request the recording never saw shows that the
+prompts changed.
+"""
+import json
+import math
+import random
+import threading
+import time
+from collections import defaultdict, deque
+
+from smartworkers.backends import BackendError, Completion, LLMBackend
+from smartworkers.cache import cache_key
+
+
+def constant(seconds: float):
+    return lambda rng: seconds
+
+
+def uniform(low: float, high: float):
+    return lambda rng: rng.uniform(low, high)
+
+
+def lognormal(median: float, sigma: float):
+    """Long tailed latencies as seen from hosted models, median in seconds"""
+    mu = math.log(median) if median > 0 else 0.0
+    return lambda rng: rng.lognormvariate(mu, sigma) if median > 0 else 0.0
+
+
+LATENCIES = {
+    "constant": constant,
+    "uniform": uniform,
+    "lognormal": lognormal,
+}
+
+
+def parse_latency(spec: str):
+    """Latency distribution from a spec such as "0.05", "uniform:0.01:0.1" or "lognormal:0.05:0.6" """
+    name, _, args = spec.partition(":")
+    if name not in LATENCIES:
+        return constant(float(spec))
+    return LATENCIES[name](*(float(arg) for arg in args.split(":") if arg))
+
+
+class ScriptedBackend(LLMBackend):
+    """Answers every request in process from script(messages, rng) after a latency drawn from latency(rng).
+
+    Both draw from a generator seeded with the seed, the request and how often that same
+    request was seen before, so a sequential run gets the same answers and latencies every
+    time. Usage is reported as a quarter of the characters, like the estimate of TokenCounter.
+    """
+
+    def __init__(self, script, latency=None, seed: int = 0):
+        self.script = script
+        self.latency = latency or constant(0.0)
+        self.seed = seed
+        self._seen = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def chat(self, messages: list[dict[str, str]], model: str, temperature: float) -> Completion:
+        key = cache_key(model, temperature, messages)
+        with self._lock:
+            occurrence = self._seen[key]
+            self._seen[key] += 1
+        rng = random.Random(f"{self.seed}:{key}:{occurrence}")
+        content = self.script(messages, rng)
+        delay = self.latency(rng)
+        if delay > 0:
+            time.sleep(delay)
+        prompt_tokens = sum(len(message["content"]) for message in messages) // 4 + 1
+        return Completion(content, model, {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4 + 1})
+
+
+class RecordingBackend(LLMBackend):
+    """Writes every completion of the wrapped backend to a transcript"""
+
+    def __init__(self, backend: LLMBackend, path: str, header: dict = None):
+        self.backend = backend
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'w', encoding='utf-8')
+        if header is not None:
+            self._write(dict(header, type="header"))
+
+    def _write(self, record: dict):
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def chat(self, messages: list[dict[str, str]], model: str, temperature: float) -> Completion:
+        start = time.monotonic()
+        completion = self.backend.chat(messages, model, temperature)
+        self._write({
+            "type": "response",
+            "key": cache_key(model, temperature, messages),
+            "content": completion.content,
+            "model": completion.model,
+            "usage": completion.usage,
+            "latency": round(time.monotonic() - start, 6),
+        })
+        return completion
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        self.backend.close()
+
+
+def read_transcript(path: str) -> (dict, list[dict]):
+    """Header and response records of a transcript"""
+    header, responses = {}, []
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get("type") == "header":
+                header = record
+            elif record.get("type") == "response":
+                responses.append(record)
+    return header, responses
+
+
+class ReplayBackend(LLMBackend):
+    """Answers requests with the completions of a transcript.
+
+    Repeated requests get their recorded answers in order. latency replaces the recorded
+    latencies, which are slept scaled by latency_scale otherwise. In strict mode a request
+    that is not in the transcript fails with a BackendError, else the recorded answers
+    not used yet are served in order.
+    """
+
+    def __init__(self, path: str, strict: bool = True, latency=None, latency_scale: float = 1.0, seed: int = 0):
+        self.header, records = read_transcript(path)
+        self.strict = strict
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self.misses = 0
+        self._rng = random.Random(seed)
+        self._by_key = defaultdict(deque)
+        for record in records:
+            self._by_key[record["key"]].append(record)
+        self._unused = deque(records)
+        self._served = set()
+        self._lock = threading.Lock()
+
+    def _next(self, key: str) -> (dict, float):
+        with self._lock:
+            queue = self._by_key.get(key)
+            while queue and id(queue[0]) in self._served:
+                queue.popleft()
+            if queue:
+                record = queue.popleft()
+            else:
+                self.misses += 1
+                if self.strict:
+                    raise BackendError(f"Request {key[:12]} is not in the transcript", 404)
+                while self._unused and id(self._unused[0]) in self._served:
+                    self._unused.popleft()
+                if not self._unused:
+                    raise BackendError("Transcript exhausted", 404)
+                record = self._unused.popleft()
+            self._served.add(id(record))
+            delay = self.latency(self._rng) if self.latency is not None else record.get("latency", 0.0) * self.latency_scale
+        return record, delay
+
+    def chat(self, messages: list[dict[str, str]], model: str, temperature: float) -> Completion:
+        record, delay = self._next(cache_key(model, temperature, messages))
+        if delay > 0:
+            time.sleep(delay)
+        return Completion(record["content"], record.get("model") or model, record.get("usage"))
@@ -0,0 +1,231 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+import requests
+
+from smartworkers.backends import BackendError, Completion, LLMBackend
+
+
+# Rate limits, timeouts, conflicts and server side failures are worth another try
+TRANSIENT_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(BackendError):
+    """Raised without calling the backend while its circuit breaker is open"""
+
+
+def is_transient(error: Exception) -> bool:
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, BackendError):
+        return error.status_code in TRANSIENT_STATUS_CODES
+    return isinstance(error, (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError))
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, a Retry-After from the server takes precedence"""
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 0.5, max_delay: float = 30.0, rng: random.Random = None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rng = rng or random.Random()
+
+    def delay(self, attempt: int, error: Exception = None) -> float:
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return self.rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Stops calls to a backend after failure_threshold consecutive transient failures.
+
+    After reset_timeout seconds one trial call is let through (half open), its outcome
+    closes the circuit again or reopens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_running = False
+            if self.state == self.HALF_OPEN:
+                if self._trial_running:
+                    return False
+                self._trial_running = True
+                return True
+            return self.state == self.CLOSED
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def release(self):
+        """End a trial call whose outcome says nothing about the backend, such as an abandoned stream"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logging.warning(f"Circuit breaker opened after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Recent request latencies, used to decide when a request is slow enough to hedge"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percentile: float) -> float:
+        """Latency below which the given share of requests finished, None without enough samples"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+class ResilientBackend(LLMBackend):
+    """Retries, hedging and circuit breaking around another backend.
+
+    Transient failures are retried with jittered exponential backoff, permanent ones
+    are raised at once. With hedge_percentile set, a duplicate request is sent when the
+    first one is slower than that percentile of recent latencies, and the first answer
+    wins. At most max_hedges duplicates are in flight, a slow request gets no hedge
+    while all of them are busy. While the circuit breaker is open, calls fail with
+    CircuitOpenError.
+    """
+
+    def __init__(self, backend: LLMBackend, retry: RetryPolicy = None, breaker: CircuitBreaker = None,
+                 hedge_percentile: float = None, max_hedges: int = 8):
+        self.backend = backend
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge_percentile = hedge_percentile
+        self.latencies = LatencyTracker()
+        self.retries = 0
+        self.hedges = 0
+        self._hedge_pool = ThreadPoolExecutor(max_workers=max_hedges, thread_name_prefix="hedged-request") if hedge_percentile else None
+        self._hedge_slots = threading.BoundedSemaphore(max_hedges)
+
+    def chat(self, messages: list[dict[str, str]], model: str, temperature: float) -> Completion:
+        for attempt in range(self.retry.max_attempts):
+            if not self.breaker.allow():
+                raise CircuitOpenError("Circuit breaker is open, backend is not called")
+            try:
+                completion = self._call(messages, model, temperature)
+            except Exception as e:
+                if not is_transient(e):
+                    # The backend answered and only rejected this request, so it counts as healthy
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt + 1 == self.retry.max_attempts:
+                    raise
+                delay = self.retry.delay(attempt, e)
+                logging.warning(f"Transient backend failure ({e}), retrying in {delay:.2f}s")
+                self.retries += 1
+                time.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return completion
+
+    def _timed_chat(self, messages: list[dict[str, str]], model: str, temperature: float) -> Completion:
+        start = time.monotonic()
+        completion = self.backend.chat(messages, model, temperature)
+        self.latencies.record(time.monotonic() - start)
+        return completion
+
+    def _run(self, future: Future, messages: list[dict[str, str]], model: str, temperature: float):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(self._timed_chat(messages, model, temperature))
+        except BaseException as e:
+            future.set_exception(e)
+
+    def _call(self, messages: list[dict[str, str]], model: str, temperature: float) -> Completion:
+        threshold = self.latencies.percentile(self.hedge_percentile) if self.hedge_percentile else None
+        if threshold is None:
+            return self._timed_chat(messages, model, temperature)
+
+        # The primary request never waits behind other requests, so only its own latency is compared with the threshold
+        primary = Future()
+        threading.Thread(target=self._run, args=(primary, messages, model, temperature), name="primary-request", daemon=True).start()
+        done, _ = wait([primary], timeout=threshold)
+        if done or not self._hedge_slots.acquire(blocking=False):
+            # All hedge slots are busy, a hedge would only queue and spend rate limit budget
+            return primary.result()
+
+        self.hedges += 1
+        hedge = self._hedge_pool.submit(self._timed_chat, messages, model, temperature)
+        hedge.add_done_callback(lambda _: self._hedge_slots.release())
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # A request that has not started yet is dropped, a running one finishes unobserved
+                    for loser in pending:
+                        loser.cancel()
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def stream_chat(self, messages: list[dict[str, str]], model: str, temperature: float):
+        # Chunks may already be consumed when a stream fails, so streams are not retried
+        if not self.breaker.allow():
+            raise CircuitOpenError("Circuit breaker is open, backend is not called")
+        try:
+            yield from self.backend.stream_chat(messages, model, temperature)
+        except Exception as e:
+            if is_transient(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        finally:
+            # A stream closed before its end leaves no outcome, the next call may be the trial
+            self.breaker.release()
+        self.breaker.record_success()
+
+    def stats(self) -> dict:
+        return {"retries": self.retries, "hedges": self.hedges, "circuit": self.breaker.state}
+
+    def close(self):
+        if self._hedge_pool is not None:
+            self._hedge_pool.shutdown(wait=False)
+        self.backend.close()
@@ -0,0 +1,162 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from smartworkers.commands import FinishContract
+from smartworkers.contract import Contract, compile_contracts
+
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"  # the agent finished the contract with /finish_contract
+RETURNED = "returned"  # the agent returned the contract to the requester for more input
+UNFINISHED = "unfinished"  # the agent ran out of rounds of the plan
+FAILED = "failed"
+REJECTED = "rejected"
+STATUSES = (QUEUED, RUNNING, DONE, RETURNED, UNFINISHED, FAILED, REJECTED)
+
+
+class ContractJob:
+    """One contract entry waiting for, or run by, an agent of the scheduler"""
+    __slots__ = ('id', 'contract', 'priority', 'budget', 'currency', 'status', 'result', 'error', 'started', 'finished')
+
+    def __init__(self, job_id: int, contract: Contract, priority: float, budget: float, currency: str):
+        self.id = job_id
+        self.contract = contract
+        self.priority = priority
+        self.budget = budget
+        self.currency = currency
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.started = None
+        self.finished = None
+
+
+class ContractScheduler:
+    """Runs many contracts concurrently on a pool of agents.
+
+    agent_factory(job) returns the SmartWorkerAgent running the job, usually sharing one
+    RateLimitedBackend so that all agents stay within the requests and tokens per
+    minute of the model. Jobs run in priority order, lowest first, defaulting to the
+    highest budget first. budget_limits caps, per currency, the total budget of the
+    contracts running at the same time, contracts above the cap on their own are rejected.
+    """
+
+    def __init__(self, agent_factory, max_agents: int = 4, budget_limits: dict = None):
+        self.agent_factory = agent_factory
+        self.max_agents = max_agents
+        self.budget_limits = budget_limits or {}
+        self.jobs = []
+        self._heap = []
+        self._ids = itertools.count()
+        self._committed = {}
+        self._running = 0
+        self._changed = threading.Condition()
+        self._started = None
+        self._finished = None
+
+    def submit(self, contract, priority: float = None) -> list[ContractJob]:
+        """Queue every entry of a contract array, raises ContractError if an entry is invalid"""
+        jobs = []
+        for contract in compile_contracts(contract):
+            budget, currency = contract.value.amount, contract.value.currency
+            job = ContractJob(next(self._ids), contract, -budget if priority is None else priority, budget, currency)
+            limit = self.budget_limits.get(currency)
+            with self._changed:
+                self.jobs.append(job)
+                if limit is not None and budget > limit:
+                    job.status = REJECTED
+                    job.error = f"Budget {budget} {currency} is above the limit of {limit} {currency}"
+                    logging.warning(f"Contract {job.id} rejected: {job.error}")
+                else:
+                    heapq.heappush(self._heap, (job.priority, job.id, job))
+                    self._changed.notify_all()
+            jobs.append(job)
+        return jobs
+
+    def _admissible(self, job: ContractJob) -> bool:
+        limit = self.budget_limits.get(job.currency)
+        return limit is None or self._committed.get(job.currency, 0.0) + job.budget <= limit
+
+    def _next_job(self) -> ContractJob:
+        """Highest priority job whose budget fits, None once the queue is drained"""
+        with self._changed:
+            while True:
+                if not self._heap:
+                    return None
+                skipped = []
+                job = None
+                while self._heap:
+                    candidate = heapq.heappop(self._heap)
+                    if self._admissible(candidate[2]):
+                        job = candidate[2]
+                        break
+                    skipped.append(candidate)
+                for item in skipped:
+                    heapq.heappush(self._heap, item)
+                if job is not None:
+                    self._committed[job.currency] = self._committed.get(job.currency, 0.0) + job.budget
+                    self._running += 1
+                    return job
+                # Every waiting contract is over budget until a running one finishes
+                self._changed.wait()
+
+    def _release(self, job: ContractJob):
+        with self._changed:
+            self._committed[job.currency] -= job.budget
+            self._running -= 1
+            self._changed.notify_all()
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            job.status = RUNNING
+            job.started = time.monotonic()
+            try:
+                agent = self.agent_factory(job)
+                agent.load_contract(job.contract)
+                job.result = agent.execute()
+                job.status = self.outcome(job.result)
+            except Exception as e:
+                logging.exception(f"Contract {job.id} failed")
+                job.error = str(e)
+                job.status = FAILED
+            job.finished = time.monotonic()
+            self._release(job)
+
+    @staticmethod
+    def outcome(result) -> str:
+        """Status of a job from the result of SmartWorkerAgent.execute()"""
+        if result == f"/{FinishContract.name}":
+            return DONE
+        if result is None:
+            return UNFINISHED
+        # Any other result is the prompt built from the requester's additional input
+        return RETURNED
+
+    def run(self) -> list[ContractJob]:
+        """Run every queued contract, returns all jobs once the queue is drained"""
+        self._started = time.monotonic()
+        workers = [threading.Thread(target=self._work, name=f"contract-agent-{index}", daemon=True) for index in range(self.max_agents)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self._finished = time.monotonic()
+        return self.jobs
+
+    def stats(self) -> dict:
+        end = self._finished or time.monotonic()
+        elapsed = end - self._started if self._started is not None else 0.0
+        counts = {status: sum(1 for job in self.jobs if job.status == status) for status in STATUSES}
+        return {
+            **counts,
+            "elapsed": elapsed,
+            # Only contracts the agents finished count, returned and unfinished ones do not
+            "contracts_per_hour": counts[DONE] / elapsed * 3600 if elapsed else 0.0,
+        }
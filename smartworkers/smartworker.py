@@ -1,21 +1,23 @@
-import openai
+import itertools
 import json
-import subprocess
 import logging
-import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from nltk import tokenize
 import nltk
-
-class SmartWorkerAgent:
-    def __init__(self, gpt_api_key: str, gpt_model: str):
-        self.memory = []
-        self.gpt_model = gpt_model
-        self.gpt_api_key = gpt_api_key
-        self.contract = None
-        self.messages = [{
-            "role": "user",
-            "content": """
+from smartworkers.backends import LLMBackend, OpenAIBackend
+from smartworkers.cache import ResponseCache, cache_key
+from smartworkers.journal import ConversationJournal, replay_journal
+from smartworkers.context import ContextWindow
+from smartworkers.conversation import Conversation
+from smartworkers.executor import CodeExecutor, ExecutionResult
+from smartworkers.voting import QuorumVote, ResponseHistory
+from smartworkers.contract import Contract, compile_contract
+from smartworkers.tracing import NULL_TRACER, Tracer, propagate
+from smartworkers.commands import Command, FinishContract, ReturnContract, RunCode, WriteFile, first_command, parse_commands
+
+
+SYSTEM_MESSAGE = """
             [SYSTEM INFORMATION] =
 ^[System Message]: "This is a CompuLingo Request (structured language for LLMs). "[]" is parameter, "^" is indentation level, "/" is delimiter, "~~~" is section divider"/
 ^[Initial Prompt]: "As SmartWorker, your goal is to solve a given problem through task management with Agents."/
@@ -37,59 +39,128 @@ To use any of this command, you need to have a solid justification for it.
 You will work with multiple experts on each task, coordinating your efforts to reach a comprehensive solution. If a task is completed to satisfaction, you should initiate the next one.
 Plan actions and execute them.
             """
-        }]
 
-    def load_contract(self, contract: dict):
-        self.contract = contract
+# Shared root of all agent conversations, forks copy it on write
+SYSTEM_CONVERSATION = Conversation([{"role": "user", "content": SYSTEM_MESSAGE}]).freeze()
+
+
+class SmartWorkerAgent:
+    # Cached responses are shared by all agents of the same namespace
+    cache_namespace = None
+
+    def __init__(self, gpt_api_key: str, gpt_model: str, max_concurrent_experts: int = 3, backend: LLMBackend = None, cache: ResponseCache = None, journal: ConversationJournal = None, context_window: ContextWindow = None, conversation: Conversation = None, code_executor: CodeExecutor = None,
+                 quorum: int = None, similarity_threshold: float = 0.8, max_revisions: int = 3, past_response_limit: int = 1000, tracer: Tracer = None,
+                 round_delay: float = 10.0, max_rounds: int = None):
+        self.memory = []
+        self.gpt_model = gpt_model
+        self.gpt_api_key = gpt_api_key
+        # Transport to the model, experts created by execute() share it and its connection pool
+        self.backend = backend if backend is not None else OpenAIBackend(gpt_api_key)
+        # Opt-in response cache, shared with the experts as well
+        self.cache = cache
+        # Append-only record of the conversation, replayed by restore_from_journal()
+        self.journal = journal
+        # Optional token budget for every request, without it the whole history is sent
+        self.context_window = context_window
+        # Sandboxed runner for /run_code, each file is run once and the result is reused
+        self.code_executor = code_executor if code_executor is not None else CodeExecutor()
+        # Spans of plan formation, expert queries, votes, code runs and file writes, shared with the experts
+        self.tracer = tracer if tracer is not None else NULL_TRACER
+        self.plan = None
+        self.plan_position = 0
+        # Responses of earlier steps, similar ones are sent back to the experts for revision
+        self.past_responses = ResponseHistory(past_response_limit, similarity_threshold)
+        # Experts stop being polled once this many agree, None means a majority of them
+        self.quorum = quorum
+        self.similarity_threshold = similarity_threshold
+        self.max_revisions = max_revisions
+        self.contract = None
+        # Hashes of the contracts already introduced in the conversation by a system message
+        self.contract_hashes = set()
+        # Upper bound of expert queries in flight at once, shared by every step of execute()
+        self.max_concurrent_experts = max_concurrent_experts
+        # execute() pauses round_delay seconds before every pass over the plan, and gives up after max_rounds passes if set
+        self.round_delay = round_delay
+        self.max_rounds = max_rounds
+        # Last parsed response, the same message goes through query_gpt, handle_action and get_feedback
+        self._parsed = (None, [])
+        # Every agent branches off the shared, immutable CompuLingo preamble
+        self.messages = (conversation if conversation is not None else SYSTEM_CONVERSATION).fork()
+
+    def load_contract(self, contract) -> Contract:
+        """Compile and load a contract entry, given as JSON, parsed JSON or a compiled Contract"""
+        self.contract = compile_contract(contract) if contract else None
+        return self.contract
 
     def write_messages_to_file(self, filename: str):
         with open(filename, 'w') as file:
             json.dump(self.convert_messages_to_strings(self.messages), file)
 
+    def add_message(self, message: dict[str, str]):
+        self.messages.append(message)
+        if self.journal is not None:
+            self.journal.append({"type": "message", "message": message})
+
+    def add_memory(self, item):
+        self.memory.append(item)
+        if self.journal is not None:
+            self.journal.append({"type": "memory", "item": item})
+
+    def restore_from_journal(self, path: str) -> bool:
+        """Rebuild messages, memory and plan position from a journal, returns False if there is nothing to restore"""
+        state = replay_journal(path)
+        if not state.messages and not state.memory and state.plan is None:
+            return False
+        self.messages.extend(state.messages)
+        self.memory.extend(state.memory)
+        self.plan = state.plan
+        self.plan_position = state.position
+        self.past_responses.update(state.past_responses)
+        self.contract_hashes.update(state.contracts)
+        logging.info(f"Restored {len(state.messages)} messages and plan position {state.position} from {path}")
+        return True
+
 
     def get_llm_prompt(self) -> str:
-        contract = self.contract_to_llm(self.contract)
-        
-        # Check if the contract message has already been added
-        contract_message_exists = any(
-            message["role"] == "system" and contract in message["content"]
-            for message in self.messages
-        )
-        
+        contract = self.contract
+
         # Only append the contract message if it doesn't exist already
-        if not contract_message_exists:
-            self.messages.append({
-                "role": "system", 
-                "content": f"You are a helpful assistant. Your task is to understand and complete the given contract: {contract}"
-            })
-        
-        return contract
+        if contract.hash not in self.contract_hashes:
+            self.add_message({"role": "system", "content": contract.render("system")})
+            self.contract_hashes.add(contract.hash)
+            if self.journal is not None:
+                self.journal.append({"type": "contract", "hash": contract.hash})
+
+        return contract.render("llm")
 
     def contract_to_llm(self, contract_string):  # TODO: automatic llm smart contract translation
-        contract = json.loads(contract_string)
-        action = contract[0]["Action"]
-        output_columns = ", ".join([f"{column['name']} ({column['description']})" for column in action['OutputColumns']])
-        llm_prompt = f"{action['Prompt']} The output should be in {action['OutputFormat']} format and contain the following fields: {output_columns}. "
-        llm_prompt += f"Acceptance criteria: {contract[0]['ContractCompleteness']['AcceptanceCriteria']}."
-        llm_prompt += f"PDF file is aviable in {action['SourceFile']}."
-        return llm_prompt
+        return compile_contract(contract_string).render("llm")
     
 
     def form_plan(self, action: str) -> list[str]:
         """Query GPT model and use the response as a plan"""
     # Add a more explicit prompt to encourage the model to form a plan
         plan_prompt = action + " Now I'm going to form a plan for completing this task."
-        response = self.query_gpt(plan_prompt)
-
-        # Plan will be a list of actions to be done
-        plan = []
-
-        if response:
-            # Use NLTK to extract sentences from the response.
-            # Each sentence should ideally represent a step or action in the plan
-            plan = tokenize.sent_tokenize(response)
+        with self.tracer.span("plan") as span:
+            response = self.query_gpt(plan_prompt)
+            if isinstance(response, Exception):
+                # Without a plan there is nothing to execute
+                raise response
+
+            # Plan will be a list of actions to be done
+            plan = []
+
+            if response:
+                plan = self.split_plan(response)
+            span.set(steps=len(plan))
         return plan
 
+    def split_plan(self, response: str) -> list[str]:
+        """Steps of the plan in the model's response"""
+        # Use NLTK to extract sentences from the response.
+        # Each sentence should ideally represent a step or action in the plan
+        return tokenize.sent_tokenize(response)
+
         
     def handle_unrecognized_action(self, action: str) -> str:
     # Fetch self-feedback for the action
@@ -116,15 +187,24 @@ Plan actions and execute them.
         return self_feedback
 
 
+    def commands_in(self, action: str) -> list[Command]:
+        """Commands of a response, parsed once per message"""
+        if not isinstance(action, str):
+            return []
+        if self._parsed[0] is not action:
+            self._parsed = (action, parse_commands(action))
+        return self._parsed[1]
+
     def handle_action(self, action: str) -> str:
-        if "/return_contract" in action:
-            return self.request_additional_input()
-        elif "/finish_contract" in action:
+        commands = self.commands_in(action)
+        if first_command(commands, ReturnContract):
+            return self.request_additional_input(action)
+        elif first_command(commands, FinishContract):
             return self.finish_contract()
-        elif "/run_code" in action:
+        elif first_command(commands, RunCode):
             print('run code command found')
             return self.run_code(action)
-        elif "/write_file" in action:
+        elif first_command(commands, WriteFile):
             return self.write_file(action)
         else:
             # Handle actions without specific command
@@ -137,38 +217,55 @@ Plan actions and execute them.
     def run_code(self, action: str) -> str:
         filename = self.validate_filename(action)
         if filename is not None:
-            os.system(f'python {filename}')
-            return f"Executed {filename}"
+            try:
+                result = self.traced_run(filename)
+            except OSError as e:
+                # The file is hashed before it runs, a missing or unreadable one never starts
+                logging.warning(f"Could not run {filename}: {e}")
+                return f"Invalid filename. Could not read {filename}."
+            return f"Executed {filename}" if result.ok else f"Executed {filename} with errors"
         else:
             return "Invalid filename."
 
     def write_file(self, action: str) -> str:
         filename, file_content = self.validate_file_input(action)
         if filename is not None and file_content is not None:
-            with open(filename, 'w') as file:
-                file.write(file_content)
+            with self.tracer.span("write_file", file=filename, chars=len(file_content)):
+                with open(filename, 'w') as file:
+                    file.write(file_content)
             return f"Written to {filename}"
         else:
             return "Invalid file input."
 
+    def traced_run(self, filename: str) -> ExecutionResult:
+        """Run a file with the code executor inside a run_code span"""
+        with self.tracer.span("run_code", file=filename) as span:
+            result = self.code_executor.run(filename)
+            span.set(cached=result.cached, returncode=result.returncode, timed_out=result.timed_out)
+        return result
+
     def validate_filename(self, action: str) -> str:
-        filename = action.split(" ")[1] if len(action.split(" ")) > 1 else None
-        return filename
+        command = first_command(self.commands_in(action), RunCode)
+        return command.filename if command is not None else None
 
     def validate_file_input(self, action: str) -> (str, str):
-        parts = action.split(" ")
-        filename = parts[1] if len(parts) > 2 else None
-        file_content = " ".join(parts[2:]) if len(parts) > 2 else None
-        return filename, file_content
+        command = first_command(self.commands_in(action), WriteFile)
+        if command is None or command.filename is None:
+            return None, None
+        return command.filename, command.content
     
     def get_feedback(self, action: str) -> str:
-        if "/run_code" in action:
+        if first_command(self.commands_in(action), RunCode):
             filename = self.validate_filename(action)
             if filename is not None:
                 try:
-                    # Running the file and capturing output
-                    process = subprocess.run(['python', filename], capture_output=True, text=True)
-                    feedback = process.stdout
+                    # Running the file and capturing output, run_code() of the same file reuses the result
+                    result = self.traced_run(filename)
+                    feedback = result.stdout
+                    if result.timed_out:
+                        feedback += f"\n[Execution timed out after {self.code_executor.timeout}s]"
+                    elif result.returncode != 0:
+                        feedback += result.stderr
                 except Exception as e:
                     feedback = str(e)
             else:
@@ -185,7 +282,7 @@ Plan actions and execute them.
         confirm_prompt = f"The action performed was: '{action}', which suggests closing the contract. Are you sure you want to proceed with this action?"
         confirmation = self.query_gpt(confirm_prompt)
 
-        if not confirmation:
+        if not confirmation or isinstance(confirmation, Exception):
             # Default feedback in case GPT-3 doesn't provide any.
             confirmation = "No confirmation was provided by the GPT model for this action."
 
@@ -197,60 +294,71 @@ Plan actions and execute them.
         feedback_prompt = f"The action performed was: '{action}'. Please provide feedback on this action."
         feedback = self.query_gpt(feedback_prompt)
 
-        if not feedback:
+        if not feedback or isinstance(feedback, Exception):
             # Default feedback in case GPT-3 doesn't provide any.
             feedback = "No feedback was provided by the GPT model for this action."
 
         return feedback
 
     def converse(self, prompt):
-        self.memory.append(prompt)
-        # The expert uses its memory to generate a response
-        response = self.query_gpt(self.memory)
-        feedback = self.get_feedback(response)  # Ensure the get_feedback method is defined in Expert class
+        with self.tracer.span("converse"):
+            self.add_memory(prompt)
+            # The expert uses its memory to generate a response
+            response = self.query_gpt(self.memory)
+            feedback = self.get_feedback(response)  # Ensure the get_feedback method is defined in Expert class
         return response, feedback
 
 
-    def query_gpt(self, conversation: list, gpt_version: str = "gpt-4") -> str:
-        openai.api_key = self.gpt_api_key
+    def query_gpt(self, conversation: list, gpt_version: str = "gpt-4", use_cache: bool = True) -> str:
+        """Response of the model to the last prompt, or the exception if the backend failed"""
+        # A single prompt may be passed instead of a conversation
+        prompt = conversation if isinstance(conversation, str) else conversation[-1]
 
         # Prepare a new message for the conversation
-        new_message = {"role": "user", "content": str(conversation[-1]) + "[MESSAGE FROM ORCHESTRATOR] If needed, Please include one of the following commands in your response as appropriate: /return_contract, /finish_contract, /run_code, /write_file, /read_file."}
+        new_message = {"role": "user", "content": str(prompt) + "[MESSAGE FROM ORCHESTRATOR] If needed, Please include one of the following commands in your response as appropriate: /return_contract, /finish_contract, /run_code, /write_file, /read_file."}
 
-        # Append the new message to the conversation
-        conversation_with_new_message = self.messages + [new_message]
+        # Append the new message to the conversation, trimmed to the token budget if there is one
+        if self.context_window is not None:
+            conversation_with_new_message = self.context_window.build(self.messages.as_dicts(), new_message)
+        else:
+            conversation_with_new_message = self.messages + [new_message]
 
-        # Prepare the API request parameters
-        params = {
-            "model": gpt_version,
-            "messages": conversation_with_new_message,
-            # "max_tokens": 10000,
-            "temperature": 0.1,
-        }
+        temperature = 0.1
+        with self.tracer.span("query", model=gpt_version) as span:
+            key = cache_key(gpt_version, temperature, conversation_with_new_message, self.cache_namespace) if self.cache is not None and use_cache else None
+            message = self.cache.get(key) if key is not None else None
+            if key is not None:
+                span.set(cached=message is not None)
 
-        try:
-            response = openai.ChatCompletion.create(**params)
-            message = response.choices[0]['message']['content']
-            logging.info(f"Received message: {message}")
-        except Exception as e:
-            message = str(e)
-            logging.error(f"Error during message receipt: {message}")
+            if message is not None:
+                logging.info(f"Received cached message: {message}")
+            else:
+                try:
+                    completion = self.backend.chat(conversation_with_new_message, gpt_version, temperature)
+                    message = completion.content
+                    self.tracer.record_completion(gpt_version, conversation_with_new_message, completion)
+                    logging.info(f"Received message: {message}")
+                    if key is not None:
+                        self.cache.put(key, message)
+                except Exception as e:
+                    # The error is returned to the caller instead of becoming part of the conversation
+                    logging.error(f"Error during message receipt: {e}")
+                    span.fail(e)
+                    return e
 
         # Check if the response contains a command
-        commands = ["/return_contract", "/finish_contract", "/run_code", '/write_file']
-        if any(command in message for command in commands):
-            if "/finish_contract" in message:
-                confirmation = self.confirm_closure(message)
-                if 'yes' in confirmation.lower():
-                    print('Contract ready for validation')
-                    return "/finish_contract"
-            elif "/return_contract" in message:
-                return self.request_additional_input(message)
+        commands = self.commands_in(message)
+        if first_command(commands, FinishContract):
+            confirmation = self.confirm_closure(message)
+            if 'yes' in confirmation.lower():
+                print('Contract ready for validation')
+                return "/finish_contract"
+        elif first_command(commands, ReturnContract):
+            return self.request_additional_input(message)
 
         # Append the assistant's message to the conversation
-        self.messages.append({"role": "assistant", "content": message})
+        self.add_message({"role": "assistant", "content": message})
         logging.info(f"Added new message to conversation: {self.messages[-1]}")
-        self.write_messages_to_file('conversation_history.json')
         return message
 
 
@@ -261,64 +369,151 @@ Plan actions and execute them.
         input_str = input()
         additional_input_prompt += input_str
         # Add the additional input prompt as a user message in the conversation
-        self.messages.append({"role": "user", "content": additional_input_prompt})
+        self.add_message({"role": "user", "content": additional_input_prompt})
         return additional_input_prompt
 
+    def poll_experts(self, experts: list, prompt: str, past_responses: ResponseHistory, common_memory: list, executor: ThreadPoolExecutor = None) -> QuorumVote:
+        """Poll experts about the prompt until enough of them agree, returns the vote"""
+        quorum = self.quorum if self.quorum is not None else len(experts) // 2 + 1
+        with self.tracer.span("vote", quorum=quorum) as span:
+            vote = self._poll(experts, prompt, past_responses, common_memory, executor, quorum)
+            span.set(responses=len(vote.responses), reached=vote.reached)
+        return vote
+
+    def _poll(self, experts: list, prompt: str, past_responses: ResponseHistory, common_memory: list, executor: ThreadPoolExecutor, quorum: int) -> QuorumVote:
+        vote = QuorumVote(quorum, self.similarity_threshold, past_responses.hasher)
+        remaining = list(experts)
+        error = None
+
+        while remaining and not vote.reached:
+            # Only as many experts as could still complete the quorum are asked at once
+            wave, remaining = remaining[:vote.needed], remaining[vote.needed:]
+            if executor is not None:
+                # Expert spans started on the pool threads are children of the vote
+                futures = [executor.submit(propagate(expert.converse), prompt) for expert in wave]
+                answers = [future.result() for future in futures]
+            else:
+                answers = [expert.converse(prompt) for expert in wave]
+
+            # Revisions are resolved in expert order, so results do not depend on timing
+            for expert, (result, feedback) in zip(wave, answers):
+                revisions = 0
+                # Every response is hashed once, the vote and the history reuse its fingerprint
+                fingerprint = past_responses.fingerprint(result) if not isinstance(result, Exception) else None
+                while fingerprint is not None and past_responses.find(result, fingerprint) is not None and revisions < self.max_revisions:  # Check for repetition
+                    # If the result repeats a response of an earlier step, get feedback for the action
+                    feedback = self.get_feedback_for_action(result)
+                    common_memory.append(feedback)
+                    result = expert.revise_response(common_memory[-1])
+                    fingerprint = past_responses.fingerprint(result) if not isinstance(result, Exception) else None
+                    revisions += 1
+                if isinstance(result, Exception):
+                    # An expert whose backend failed is dropped from the vote, errors never become feedback
+                    logging.warning(f"Expert gave no response: {result}")
+                    error = result
+                    continue
+                vote.add(result, feedback, fingerprint)
+
+        if not vote.responses and error is not None:
+            raise error
+        return vote
+
+    def create_expert(self, index: int) -> 'Expert':
+        """Create an expert sharing the agent's backend and cache, resumed from its own journal if there is one"""
+        context_window = self.context_window.fork() if self.context_window is not None else None
+        expert = Expert(self.gpt_api_key, backend=self.backend, cache=self.cache, context_window=context_window, code_executor=self.code_executor, tracer=self.tracer, name=f"expert{index}")
+        if self.journal is not None:
+            path = self.journal.path_for(f"expert{index}")
+            expert.restore_from_journal(path)
+            expert.journal = ConversationJournal(path, self.journal.batch_size, self.journal.flush_interval)
+        return expert
+
     def execute(self):
+        with self.tracer.span("contract", contract=self.contract.hash):
+            return self._execute()
+
+    def _execute(self):
         llm_prompt = self.get_llm_prompt()
-        plan = self.form_plan(llm_prompt)
+
+        # A plan restored from the journal is reused instead of asking the model again
+        if self.plan is None:
+            self.plan = self.form_plan(llm_prompt)
+            if self.journal is not None:
+                self.journal.append({"type": "plan", "plan": self.plan})
+        plan = self.plan
 
         # Introduce tree of thought with multiple experts
-        experts = [Expert(self.gpt_api_key) for _ in range(3)]
+        experts = [self.create_expert(index) for index in range(3)]
 
-        # Create a set to store past responses
-        past_responses = set()
+        # History of past responses, restored from the journal after a restart
+        past_responses = self.past_responses
 
         # create a common_memory for all experts
         common_memory = []
 
-        # iterate over each step of the plan
-        while True:
-            time.sleep(10)
-            for action in plan:
-                print(f"# # Executing action: {action}")
-                common_memory.append(action)
+        # The executor is shared across steps, so max_concurrent_experts caps the whole run
+        executor = ThreadPoolExecutor(max_workers=self.max_concurrent_experts) if self.max_concurrent_experts > 1 else None
+
+        step = 0
+        rounds = itertools.count() if self.max_rounds is None else range(self.max_rounds)
+        try:
+            # iterate over each step of the plan
+            for _ in rounds:
+                if self.round_delay:
+                    time.sleep(self.round_delay)
+                for action in plan:
+                    # Steps finished before a restart are not executed again
+                    if step < self.plan_position:
+                        step += 1
+                        continue
 
-                # Polling mechanism
-                proposed_actions = []
-                feedbacks = []
+                    with self.tracer.span("step", step=step):
+                        print(f"# # Executing action: {action}")
+                        common_memory.append(action)
 
-                for expert in experts:
-                    result, feedback = expert.converse(common_memory[-1]) # Now the common_memory contains the last action.
+                        # Polling mechanism, every expert gets the action of the step
+                        vote = self.poll_experts(experts, action, past_responses, common_memory, executor)
+                        proposed_actions = vote.responses
+                        past_responses.update(proposed_actions, vote.fingerprints)
 
-                    while isinstance(result, Exception) or result in past_responses:  # Check for repetition
-                        # If the result is a repeat of a past response or an error, get feedback for the action
-                        feedback = self.get_feedback_for_action(result)
-                        common_memory.append(feedback)
-                        result = expert.revise_response(common_memory[-1])
+                        # Decide next action based on expert opinions, near-duplicate responses count as one
+                        next_action, action_feedback = vote.winner
 
-                    # After receiving result, store it in memory
-                    past_responses.add(result)
-                    proposed_actions.append(result)
-                    feedbacks.append(feedback)
+                        # Use feedback to update llm_prompt for the next action
+                        llm_prompt = action_feedback
 
-                # Decide next action based on expert opinions using majority vote
-                next_action = max(set(proposed_actions), key = proposed_actions.count)
-                action_feedback = feedbacks[proposed_actions.index(next_action)]
+                        # Check if task needs to be returned for additional input
+                        if first_command(self.commands_in(next_action), ReturnContract):
+                            return self.request_additional_input(next_action)
 
-                # Use feedback to update llm_prompt for the next action
-                llm_prompt = action_feedback
+                        # Closure was confirmed by the expert whose response won the vote
+                        if next_action == self.finish_contract():
+                            print("Task completed!")
+                            return next_action
 
-                # Check if task needs to be returned for additional input
-                if "/return_contract" in next_action:
-                    return self.request_additional_input(next_action)
+                        # Verify if the task is completed with self-feedback
+                        self_feedback = self.get_feedback_for_action(next_action)
 
-                # Verify if the task is completed with self-feedback
-                self_feedback = self.get_feedback_for_action(next_action)
-                
+                        step += 1
+                        self.plan_position = step
+                        if self.journal is not None:
+                            # The experts' messages and memory of the step reach the disk before the step counts as done
+                            for expert in experts:
+                                if expert.journal is not None:
+                                    expert.journal.flush()
+                            self.journal.append({"type": "step", "position": step, "proposed": proposed_actions})
+                            self.journal.flush()
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False)
+            for expert in experts:
+                if expert.journal is not None:
+                    expert.journal.close()
+            if self.journal is not None:
+                self.journal.flush()
 
-        # Task is completed
-        print("Task completed!")
+        logging.warning(f"Contract not finished after {self.max_rounds} rounds of the plan")
+        return None
 
 
 
@@ -326,19 +521,26 @@ Plan actions and execute them.
 
 
 class Expert(SmartWorkerAgent):
-    def __init__(self, gpt_api_key: str = None):
+    def __init__(self, gpt_api_key: str = None, backend: LLMBackend = None, cache: ResponseCache = None, context_window: ContextWindow = None, conversation: Conversation = None, code_executor: CodeExecutor = None, tracer: Tracer = None,
+                 name: str = None):
         # Call the parent's init method to initialize messages, gpt_api_key, and other attributes
-        super().__init__(gpt_api_key, None)
+        super().__init__(gpt_api_key, None, backend=backend, cache=cache, context_window=context_window, conversation=conversation, code_executor=code_executor, tracer=tracer)
         self.memory = []
+        # Experts asked the same question would otherwise all get the first expert's cached answer,
+        # a named expert caches under its own name, an unnamed one does not use the cache
+        self.name = name
+        self.cache_namespace = name
 
     def converse(self, prompt):
-        self.memory.append(prompt)
-        # The expert uses its memory to generate a response
-        response = self.query_gpt(self.memory)
-        feedback = self.get_feedback(response)  # Ensure the get_feedback method is defined in Expert class
+        with self.tracer.span("converse"):
+            self.add_memory(prompt)
+            # The expert uses its memory to generate a response
+            response = self.query_gpt(self.memory, use_cache=self.name is not None)
+            feedback = self.get_feedback(response)  # Ensure the get_feedback method is defined in Expert class
         return response, feedback
 
     def revise_response(self, feedback):
-        self.memory.append(feedback)
-        # The expert revises its response based on feedback
-        return self.query_gpt(self.memory)
+        with self.tracer.span("revise"):
+            self.add_memory(feedback)
+            # The expert revises its response based on feedback
+            return self.query_gpt(self.memory, use_cache=self.name is not None)
@@ -0,0 +1,158 @@
+"""Local OpenAI compatible chat completions server with scripted responses.
+
+    python -m smartworkers.stub_server --port 8000 --latency 0.5 --response "Plan step one. Plan step two."
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubLLMServer:
+    """Serves /v1/chat/completions from a script of responses with injected latency.
+
+    responses is either a list of strings, served in order with the last one repeated,
+    or a callable receiving the request payload and returning the content.
+    latency is either a number of seconds or a callable returning one per request.
+    faults is an optional callable receiving the request number (from 0) and payload and
+    returning None to answer normally, an HTTP status code to fail with, or "drop" to
+    close the connection without answering. Failed requests do not consume responses.
+    429 answers carry a Retry-After header of retry_after seconds.
+    """
+
+    def __init__(self, responses=None, latency=0.0, host: str = '127.0.0.1', port: int = 0, chunk_size: int = 16, faults=None,
+                 retry_after: float = 0):
+        self.responses = responses if responses is not None else ["OK"]
+        self.faults = faults
+        self.retry_after = retry_after
+        self.chunk_size = chunk_size  # characters per event of streamed responses
+        self.latency = latency
+        self.requests = []
+        self._counter = itertools.count()
+        self._request_counter = itertools.count()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> 'StubLLMServer':
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def next_fault(self, payload: dict):
+        index = next(self._request_counter)
+        with self._lock:
+            self.requests.append(payload)
+        return self.faults(index, payload) if self.faults is not None else None
+
+    def next_response(self, payload: dict) -> str:
+        index = next(self._counter)
+        if callable(self.responses):
+            return self.responses(payload)
+        return self.responses[min(index, len(self.responses) - 1)]
+
+    def next_latency(self) -> float:
+        return self.latency() if callable(self.latency) else self.latency
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, so pooled clients can reuse connections
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if not self.path.rstrip('/').endswith('/chat/completions'):
+                    return self._reply(404, {"error": {"message": f"Unknown path {self.path}"}})
+                try:
+                    payload = json.loads(raw)
+                except ValueError:
+                    return self._reply(400, {"error": {"message": "Request body is not JSON"}})
+
+                fault = stub.next_fault(payload)
+                time.sleep(stub.next_latency())
+                if fault == "drop":
+                    self.close_connection = True
+                    return
+                if fault is not None:
+                    return self._reply(fault, {"error": {"message": f"Injected fault {fault}", "type": "stub_fault"}})
+
+                content = stub.next_response(payload)
+                if payload.get("stream"):
+                    return self._stream(payload.get("model"), content)
+                self._reply(200, {
+                    "object": "chat.completion",
+                    "model": payload.get("model"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                })
+
+            def _reply(self, status: int, body: dict):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                if status == 429:
+                    self.send_header('Retry-After', str(stub.retry_after))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, model: str, content: str):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                self.close_connection = True
+                for start in range(0, len(content), stub.chunk_size):
+                    chunk = {
+                        "object": "chat.completion.chunk",
+                        "model": model,
+                        "choices": [{"index": 0, "delta": {"content": content[start:start + stub.chunk_size]}, "finish_reason": None}],
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.write(b"data: [DONE]\n\n")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI compatible stub server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--response', action='append', help="Scripted response, may be given several times")
+    args = parser.parse_args()
+
+    server = StubLLMServer(args.response, args.latency, args.host, args.port)
+    print(f"Stub LLM server listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+"""Tracing spans, token and cost accounting, and Prometheus metrics of the orchestrator.
+
+Every span is written as one JSON object per line of the trace file:
+    {"span": 7, "parent": 3, "trace": 1, "name": "converse", "start": 1700000000.0, "duration": 1.2,
+     "status": "ok", "error": null, "prompt_tokens": 812, "completion_tokens": 95, "cost": 0.0301,
+     "attributes": {"cached": false}}
+
+Token counts and cost of a span include those of its children. The metrics aggregate
+all spans in memory and are rendered in the Prometheus text format by Metrics.render().
+Agents without a tracer use NULL_TRACER, whose spans record nothing.
+"""
+import bisect
+import contextvars
+import itertools
+import json
+import threading
+import time
+
+from smartworkers.backends import Completion
+from smartworkers.context import TokenCounter
+
+
+# USD per 1000 prompt and completion tokens, models are matched by their longest prefix
+PRICES = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-32k": (0.06, 0.12),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4o": (0.005, 0.015),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo": (0.0015, 0.002),
+}
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+METRICS = {
+    "smartworker_span_duration_seconds": ("histogram", "Latency of the traced operations"),
+    "smartworker_spans_total": ("counter", "Finished spans by name and status"),
+    "smartworker_cache_lookups_total": ("counter", "Cache lookups of the traced operations by result"),
+    "smartworker_tokens_total": ("counter", "Tokens sent to and received from the model"),
+    "smartworker_cost_usd_total": ("counter", "Estimated cost of the model requests in USD"),
+}
+
+_current_span = contextvars.ContextVar("smartworkers_span", default=None)
+
+
+def propagate(function):
+    """function running in a copy of the current context, so spans started on another thread keep their parent"""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.run(function, *args, **kwargs)
+    return run
+
+
+class Span:
+    """One traced operation, used as a context manager"""
+    __slots__ = ('tracer', 'id', 'parent', 'trace', 'name', 'start', 'duration', 'error', 'attributes',
+                 'prompt_tokens', 'completion_tokens', 'cost', '_started', '_token')
+
+    def __init__(self, tracer: 'Tracer', name: str, attributes: dict):
+        self.tracer = tracer
+        self.id = next(tracer._ids)
+        self.parent = None
+        self.trace = self.id
+        self.name = name
+        self.start = None
+        self.duration = None
+        self.error = None
+        self.attributes = attributes
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+
+    def __enter__(self) -> 'Span':
+        self.parent = _current_span.get()
+        if self.parent is not None:
+            self.trace = self.parent.trace
+        self._token = _current_span.set(self)
+        self.start = time.time()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.duration = time.perf_counter() - self._started
+        _current_span.reset(self._token)
+        if exc is not None:
+            self.fail(exc)
+        self.tracer.finish(self)
+        return False
+
+    def set(self, **attributes) -> 'Span':
+        self.attributes.update(attributes)
+        return self
+
+    def fail(self, error: Exception):
+        """Mark the span as failed, for errors that are returned instead of raised"""
+        self.error = f"{type(error).__name__}: {error}"
+
+    def as_dict(self) -> dict:
+        return {
+            "span": self.id,
+            "parent": self.parent.id if self.parent is not None else None,
+            "trace": self.trace,
+            "name": self.name,
+            "start": self.start,
+            "duration": self.duration,
+            "status": "ok" if self.error is None else "error",
+            "error": self.error,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost": self.cost,
+            "attributes": self.attributes,
+        }
+
+
+class _NullSpan:
+    """Span of NULL_TRACER, records nothing"""
+    __slots__ = ()
+
+    def __enter__(self) -> '_NullSpan':
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+    def set(self, **attributes) -> '_NullSpan':
+        return self
+
+    def fail(self, error: Exception):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+def _labels(**labels) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class Metrics:
+    """Counters, gauges and latency histograms kept in memory, rendered in the Prometheus text format"""
+
+    def __init__(self, buckets: tuple = DURATION_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters = {}  # (name, labels) -> value
+        self._gauges = {}  # name -> (value, help)
+        self._histograms = {}  # (name, labels) -> [count per bucket..., count above the last bucket, sum]
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, labels: tuple = (), amount: float = 1.0):
+        with self._lock:
+            self._counters[name, labels] = self._counters.get((name, labels), 0.0) + amount
+
+    def observe(self, name: str, labels: tuple, value: float):
+        with self._lock:
+            histogram = self._histograms.get((name, labels))
+            if histogram is None:
+                histogram = self._histograms[name, labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            histogram[bisect.bisect_left(self.buckets, value)] += 1
+            histogram[-1] += value
+
+    def set_gauge(self, name: str, value: float, help: str = ""):
+        with self._lock:
+            self._gauges[name] = (value, help)
+
+    def counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get((name, _labels(**labels)), 0.0)
+
+    def total(self, name: str) -> float:
+        """Sum of a counter over all its labels"""
+        with self._lock:
+            return sum(value for (metric, _), value in self._counters.items() if metric == name)
+
+    def histograms(self, name: str) -> dict:
+        """Count and sum of every histogram of that name, by labels"""
+        with self._lock:
+            return {labels: (sum(values[:-1]), values[-1]) for (metric, labels), values in self._histograms.items() if metric == name}
+
+    def render(self) -> str:
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+            gauges = sorted(self._gauges.items())
+
+        lines = []
+        described = set()
+
+        def describe(name: str, kind: str = None, help: str = None):
+            if name not in described:
+                described.add(name)
+                kind, help = METRICS.get(name, (kind, help))
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), values in histograms:
+            describe(name)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {values[-1]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        for (name, labels), value in counters:
+            describe(name, "counter", "")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for name, (value, help) in gauges:
+            describe(name, "gauge", help)
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class Tracer:
+    """Records spans into the metrics and, with a path, into a JSONL trace file.
+
+    Trace lines are buffered and written in batches without fsync, a crash loses at
+    most the last batch. Costs use prices, USD per 1000 prompt and completion tokens.
+    """
+
+    def __init__(self, path: str = None, prices: dict = None, metrics: Metrics = None, counter: TokenCounter = None,
+                 batch_size: int = 256, flush_interval: float = 1.0):
+        self.path = path
+        self.prices = prices if prices is not None else PRICES
+        self.metrics = metrics if metrics is not None else Metrics()
+        # Estimates the tokens of backends that do not report their usage
+        self.counter = counter or TokenCounter()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spans = 0
+        self._ids = itertools.count(1)
+        self._model_prices = {}
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8') if path is not None else None
+
+    def span(self, name: str, **attributes) -> Span:
+        return Span(self, name, attributes)
+
+    def current(self) -> Span:
+        return _current_span.get()
+
+    def price(self, model: str) -> tuple:
+        """Prompt and completion price of a model, (0, 0) for unknown models"""
+        prices = self._model_prices.get(model)
+        if prices is None:
+            # Dated versions such as gpt-4-0613 are priced as their base model
+            matches = [name for name in self.prices if model and model.startswith(name)]
+            prices = self._model_prices[model] = self.prices[max(matches, key=len)] if matches else (0.0, 0.0)
+        return prices
+
+    def record_usage(self, model: str, prompt_tokens: int, completion_tokens: int, estimated: bool = False):
+        """Account the tokens of one model request to the current span"""
+        prompt_price, completion_price = self.price(model)
+        cost = (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+        span = _current_span.get()
+        if span is not None:
+            span.prompt_tokens += prompt_tokens
+            span.completion_tokens += completion_tokens
+            span.cost += cost
+            if estimated:
+                span.attributes["estimated_tokens"] = True
+        self.metrics.inc("smartworker_tokens_total", _labels(model=model, kind="prompt"), prompt_tokens)
+        self.metrics.inc("smartworker_tokens_total", _labels(model=model, kind="completion"), completion_tokens)
+        self.metrics.inc("smartworker_cost_usd_total", _labels(model=model), cost)
+
+    def record_completion(self, model: str, messages: list[dict[str, str]], completion: Completion):
+        """Account a completion, with the usage reported by the backend or an estimate of it"""
+        prompt_tokens = completion.usage.get("prompt_tokens")
+        completion_tokens = completion.usage.get("completion_tokens")
+        estimated = prompt_tokens is None or completion_tokens is None
+        if prompt_tokens is None:
+            prompt_tokens = self.counter.count_messages(messages)
+        if completion_tokens is None:
+            completion_tokens = self.counter.count_text(completion.content or "")
+        self.record_usage(completion.model or model, prompt_tokens, completion_tokens, estimated)
+
+    def finish(self, span: Span):
+        status = "ok" if span.error is None else "error"
+        self.metrics.observe("smartworker_span_duration_seconds", _labels(span=span.name), span.duration)
+        self.metrics.inc("smartworker_spans_total", _labels(span=span.name, status=status))
+        cached = span.attributes.get("cached")
+        if cached is not None:
+            self.metrics.inc("smartworker_cache_lookups_total", _labels(span=span.name, result="hit" if cached else "miss"))
+
+        line = json.dumps(span.as_dict(), ensure_ascii=False, default=str) + "\n" if self._file is not None else None
+        with self._lock:
+            self.spans += 1
+            parent = span.parent
+            if parent is not None:
+                # Children on other threads finish before their parent, which sums them up
+                parent.prompt_tokens += span.prompt_tokens
+                parent.completion_tokens += span.completion_tokens
+                parent.cost += span.cost
+            if line is not None:
+                self._buffer.append(line)
+                if len(self._buffer) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+                    self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        self._last_flush = time.monotonic()
+        if not self._buffer or self._file is None:
+            return
+        self._file.write("".join(self._buffer))
+        self._buffer.clear()
+        self._file.flush()
+
+    def stats(self) -> dict:
+        """Count and total seconds of every span name, with tokens and cost of all requests"""
+        spans = {}
+        for labels, (count, seconds) in self.metrics.histograms("smartworker_span_duration_seconds").items():
+            spans[dict(labels)["span"]] = {"count": count, "seconds": round(seconds, 3)}
+        return {
+            "spans": spans,
+            "tokens": int(self.metrics.total("smartworker_tokens_total")),
+            "cost_usd": round(self.metrics.total("smartworker_cost_usd_total"), 6),
+        }
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class NullTracer:
+    """Tracer that records nothing, the default of agents created without one"""
+    metrics = None
+
+    def span(self, name: str, **attributes) -> _NullSpan:
+        return NULL_SPAN
+
+    def current(self):
+        return None
+
+    def record_usage(self, model: str, prompt_tokens: int, completion_tokens: int, estimated: bool = False):
+        pass
+
+    def record_completion(self, model: str, messages: list[dict[str, str]], completion: Completion):
+        pass
+
+    def flush(self):
+        pass
+
+    def stats(self) -> dict:
+        return {}
+
+    def close(self):
+        pass
+
+
+NULL_TRACER = NullTracer()
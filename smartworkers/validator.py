@@ -0,0 +1,340 @@
+"""Batch validation of extracted rows against the OutputColumns of a contract.
+
+Rows are loaded into one NumPy array per output column and every check runs on whole
+columns: required fields, numeric types and ranges (AMSL/AGL heights in feet),
+allowed codes, and AIP coordinates (DDMMSS[.s]N DDDMMSS[.s]E, hemisphere letters in
+upper case as published, other characters such as JSON syntax are ignored). String
+checks are regular expressions applied by one substitution over all the cells of a
+column, never cell by cell in Python. Two independent extraction runs are aligned by
+their key columns and compared cell by cell.
+
+A row is an error if any of its cells fails a check, and ambiguous if the second
+extraction has no matching row or disagrees with it. The error and ambiguity ratios
+are compared with ErrorAcceptance and AmbiguityAcceptance of the contract.
+"""
+import re
+from operator import methodcaller
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed by the validator
+    np = None
+
+from smartworkers.contract import Contract
+
+
+TEXT = "text"
+NUMBER = "number"
+COORDINATES = "coordinates"
+
+# Heights in feet, from below sea level airfields to the upper limit of airspaces
+HEIGHT_RANGES = {
+    "amsl": (-1500.0, 66000.0),
+    "agl": (0.0, 3000.0),
+}
+CODES = re.compile(r"\b([A-Z0-9]{1,3}) for\b")
+OPTIONAL = re.compile(r"\b(if provided|optional|if any)\b", re.IGNORECASE)
+
+# Patterns applied to a whole column at once by rewrite(), one cell per line
+NUMERAL = r"[+-]?(?:\d+\.?\d*|\.\d+)"
+UNIT = re.compile(r"(?:feet|ft)$", re.MULTILINE)
+SEPARATORS = b" ,'"
+NOT_A_NUMBER = re.compile(rf"^(?!(?:fl)?{NUMERAL}$).*$", re.MULTILINE)
+FLIGHT_LEVEL = re.compile(rf"^fl({NUMERAL})$", re.MULTILINE)
+# Bytes dropped from the UTF-8 text of coordinates, everything but digits, dots, hemisphere letters and line feeds
+NOT_COORDINATE = bytes(code for code in range(256) if chr(code) not in "0123456789.NSEW\n")
+# 90 degrees of latitude and 180 of longitude are only valid without minutes and seconds
+LATITUDE = r"(?:[0-8]\d[0-5]\d[0-5]\d(?:\.\d+)?|900000(?:\.0+)?)[NS]"
+LONGITUDE = r"(?:(?:0\d\d|1[0-7]\d)[0-5]\d[0-5]\d(?:\.\d+)?|1800000(?:\.0+)?)[EW]"
+POINTS = re.compile(rf"^(?:{LATITUDE}{LONGITUDE})+$", re.MULTILINE)
+WHITESPACE = re.compile(r"[ \t\r]{2,}|[\t\r]")
+MATCHED = "+"
+
+
+class ColumnRule:
+    """Checks of one output column"""
+    __slots__ = ('name', 'kind', 'required', 'minimum', 'maximum', 'choices')
+
+    def __init__(self, name: str, kind: str = TEXT, required: bool = True, minimum: float = None, maximum: float = None, choices=None):
+        self.name = name
+        self.kind = kind
+        self.required = required
+        self.minimum = minimum
+        self.maximum = maximum
+        self.choices = tuple(choices) if choices else None
+
+    def __repr__(self):
+        return f"ColumnRule({self.name!r}, {self.kind!r}, required={self.required})"
+
+
+def infer_rules(contract: Contract) -> list[ColumnRule]:
+    """Column rules from the names and descriptions of the OutputColumns.
+
+    Columns named after AMSL or AGL are heights in feet, horizontal and coordinate
+    columns hold AIP coordinates, descriptions listing codes such as "O for Obstacle
+    A for Airspace" restrict the column to those codes, and descriptions saying
+    "if provided" make the column optional.
+    """
+    rules = []
+    for column in contract.action.output_columns:
+        name = column.name.lower()
+        required = OPTIONAL.search(column.description) is None
+        height = next((limits for unit, limits in HEIGHT_RANGES.items() if unit in name), None)
+        if height is not None:
+            rules.append(ColumnRule(column.name, NUMBER, required, *height))
+        elif "horizontal" in name or "coordinate" in name:
+            rules.append(ColumnRule(column.name, COORDINATES, required))
+        else:
+            codes = CODES.findall(column.description)
+            rules.append(ColumnRule(column.name, TEXT, required, choices=codes if len(codes) > 1 else None))
+    return rules
+
+
+def load_columns(rows: list[dict], names) -> dict:
+    """One array of stripped strings per column, missing keys, None and empty lists become empty strings"""
+    objects = np.empty(len(rows), dtype=object)
+    objects[:] = rows
+    # str() of every cell keeps list and dict values, such as coordinate points, whole
+    to_text = np.frompyfunc(str, 1, 1)
+    columns = {}
+    for name in names:
+        cells = to_text(np.frompyfunc(methodcaller('get', name), 1, 1)(objects)).astype(str) if len(rows) else np.zeros(0, dtype=str)
+        text = np.char.strip(cells)
+        columns[name] = np.where(np.isin(text, ("None", "[]", "{}")), "", text)
+    return columns
+
+
+def rewrite(text, function, dtype=str) -> 'np.ndarray':
+    """function applied to all the cells at once, as one string with a cell per line.
+
+    A single call of a C implemented string method or regular expression replaces a call
+    per cell, MULTILINE anchors of a pattern match at the bounds of the cells.
+    """
+    if len(text) == 0:
+        return np.zeros(0, dtype=dtype)
+    joined = "\n".join(text.tolist())
+    if joined.count("\n") != len(text) - 1:
+        # Line feeds inside the cells become carriage returns, so every line is one cell
+        joined = "\n".join(np.char.replace(text, "\n", "\r").tolist())
+    return np.array(function(joined).split("\n"), dtype=dtype)
+
+
+def _numbers(joined: str) -> str:
+    text = UNIT.sub("", joined.lower()).encode().translate(None, SEPARATORS).decode()
+    text = NOT_A_NUMBER.sub("nan", text)
+    # Flight levels are hundreds of feet
+    return FLIGHT_LEVEL.sub(r"\1e2", text)
+
+
+def parse_numbers(text) -> ('np.ndarray', 'np.ndarray'):
+    """Numbers and a mask of the cells that hold one, units and thousands separators are ignored.
+
+    Flight levels such as FL95 are converted to feet.
+    """
+    numbers = rewrite(text, _numbers, float)
+    return numbers, ~np.isnan(numbers)
+
+
+def _coordinates(joined: str) -> str:
+    return joined.encode().translate(None, NOT_COORDINATE).decode()
+
+
+def normalize_coordinates(text) -> 'np.ndarray':
+    """Coordinates of every cell as one string of points, such as 521200N0205600E521300N0205700E.
+
+    Digits, dots and upper case hemisphere letters are kept, all other characters are dropped.
+    """
+    return rewrite(text, _coordinates)
+
+
+def valid_coordinates(text) -> 'np.ndarray':
+    """Mask of the cells made of points in DDMMSS[.s]N DDDMMSS[.s]E form with values in range"""
+    return rewrite(text, lambda joined: POINTS.sub(MATCHED, _coordinates(joined))) == MATCHED
+
+
+def _words(joined: str) -> str:
+    return WHITESPACE.sub(" ", joined.upper())
+
+
+def occurrence_ranks(groups) -> 'np.ndarray':
+    """Number of earlier rows in the same group, for every row"""
+    if len(groups) == 0:
+        return groups
+    order = np.argsort(groups, kind='stable')
+    sorted_groups = groups[order]
+    starts = np.r_[0, np.flatnonzero(np.diff(sorted_groups)) + 1]
+    rank = np.empty(len(groups), dtype=np.int64)
+    rank[order] = np.arange(len(groups)) - np.repeat(starts, np.diff(np.r_[starts, len(groups)]))
+    return rank
+
+
+class DiffReport:
+    """Alignment of two extraction runs of the same document"""
+    __slots__ = ('matched', 'only_first', 'only_second', 'disagreements', 'disagreeing_rows')
+
+    def __init__(self, matched, only_first, only_second, disagreements: dict, disagreeing_rows):
+        self.matched = matched  # (rows of the first run, rows of the second run)
+        self.only_first = only_first
+        self.only_second = only_second
+        self.disagreements = disagreements  # column -> matched rows with a different value
+        self.disagreeing_rows = disagreeing_rows  # mask over the rows of the first run
+
+    def as_dict(self) -> dict:
+        return {
+            "matched": int(len(self.matched[0])),
+            "only_first": int(len(self.only_first)),
+            "only_second": int(len(self.only_second)),
+            "disagreements": self.disagreements,
+        }
+
+
+class ValidationReport:
+    __slots__ = ('rows', 'errors', 'error_rows', 'ambiguous_rows', 'error_acceptance', 'ambiguity_acceptance', 'diff')
+
+    def __init__(self, rows: int, errors: dict, error_rows, ambiguous_rows, error_acceptance: float, ambiguity_acceptance: float, diff: DiffReport = None):
+        self.rows = rows
+        self.errors = errors  # column -> number of invalid cells
+        self.error_rows = error_rows
+        self.ambiguous_rows = ambiguous_rows
+        self.error_acceptance = error_acceptance
+        self.ambiguity_acceptance = ambiguity_acceptance
+        self.diff = diff
+
+    @property
+    def error_ratio(self) -> float:
+        return float(self.error_rows.sum()) / self.rows if self.rows else 0.0
+
+    @property
+    def ambiguity_ratio(self) -> float:
+        return float(self.ambiguous_rows.sum()) / self.rows if self.rows else 0.0
+
+    @property
+    def passed(self) -> bool:
+        """Whether both ratios are within the thresholds of the contract, missing thresholds accept anything"""
+        return ((self.error_acceptance is None or self.error_ratio <= self.error_acceptance)
+                and (self.ambiguity_acceptance is None or self.ambiguity_ratio <= self.ambiguity_acceptance))
+
+    def as_dict(self) -> dict:
+        return {
+            "rows": self.rows,
+            "errors": self.errors,
+            "error_ratio": self.error_ratio,
+            "ambiguity_ratio": self.ambiguity_ratio,
+            "error_acceptance": self.error_acceptance,
+            "ambiguity_acceptance": self.ambiguity_acceptance,
+            "passed": self.passed,
+            "double_extraction": self.diff.as_dict() if self.diff is not None else None,
+        }
+
+
+class Validator:
+    """Validates extracted rows against a compiled contract.
+
+    rules default to infer_rules(contract). key_columns identify the same row in two
+    extraction runs, by default the coded and coordinate columns (all text columns if
+    there are none), so that differing heights or descriptions show up as
+    disagreements rather than as unmatched rows.
+    """
+
+    def __init__(self, contract: Contract, rules: list[ColumnRule] = None, key_columns: list[str] = None, tolerance: float = 0.0):
+        if np is None:
+            raise RuntimeError("numpy is required to validate extracted rows")
+        self.contract = contract
+        self.rules = rules if rules is not None else infer_rules(contract)
+        if key_columns is None:
+            key_columns = [rule.name for rule in self.rules if rule.choices or rule.kind == COORDINATES]
+            key_columns = key_columns or [rule.name for rule in self.rules if rule.kind == TEXT]
+        self.key_columns = key_columns
+        self.tolerance = tolerance
+
+    def cell_errors(self, columns: dict) -> dict:
+        """Mask of the invalid cells of every column"""
+        errors = {}
+        for rule in self.rules:
+            values = columns[rule.name]
+            absent = values == ""
+            if rule.kind == NUMBER:
+                numbers, numeric = parse_numbers(values)
+                invalid = ~absent & ~numeric
+                if rule.minimum is not None:
+                    invalid |= numeric & (numbers < rule.minimum)
+                if rule.maximum is not None:
+                    invalid |= numeric & (numbers > rule.maximum)
+            elif rule.kind == COORDINATES:
+                invalid = ~absent & ~valid_coordinates(values)
+            else:
+                invalid = np.zeros(len(values), dtype=bool)
+                if rule.choices:
+                    invalid = ~absent & ~np.isin(rewrite(values, str.upper), rule.choices)
+            if rule.required:
+                invalid |= absent
+            errors[rule.name] = invalid
+        return errors
+
+    def comparable(self, rule: ColumnRule, values):
+        """Values of a column in the form compared between extraction runs"""
+        if rule.kind == NUMBER:
+            return parse_numbers(values)[0]
+        if rule.kind == COORDINATES:
+            return normalize_coordinates(values)
+        # Free text is compared up to case and runs of whitespace
+        return rewrite(values, _words)
+
+    def row_keys(self, first: dict, second: dict, first_count: int) -> ('np.ndarray', 'np.ndarray'):
+        """Integer keys of the rows of both runs, equal for rows with the same key columns and occurrence"""
+        rules = {rule.name: rule for rule in self.rules}
+        groups = np.zeros(first_count + len(next(iter(second.values()), ())), dtype=np.int64)
+        for name in self.key_columns:
+            values = np.concatenate([self.comparable(rules[name], first[name]), self.comparable(rules[name], second[name])])
+            _, codes = np.unique(values, return_inverse=True)
+            # Combined group ids stay below the number of rows, so the product cannot overflow
+            _, groups = np.unique(groups * (int(codes.max()) + 1) + codes.ravel(), return_inverse=True)
+        # Repeated keys are matched in order, the n-th occurrence in one run with the n-th in the other
+        ranks = np.concatenate([occurrence_ranks(groups[:first_count]), occurrence_ranks(groups[first_count:])])
+        keys = groups * (int(ranks.max()) + 1) + ranks
+        return keys[:first_count], keys[first_count:]
+
+    def diff(self, first: dict, second: dict, first_count: int, second_count: int) -> DiffReport:
+        """Align two runs by their key columns and compare the other columns of matched rows"""
+        if first_count == 0 or second_count == 0:
+            matched = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+            return DiffReport(matched, np.arange(first_count), np.arange(second_count), {}, np.ones(first_count, dtype=bool))
+        first_keys, second_keys = self.row_keys(first, second, first_count)
+        _, first_rows, second_rows = np.intersect1d(first_keys, second_keys, assume_unique=True, return_indices=True)
+        only_first = np.flatnonzero(~np.isin(np.arange(first_count), first_rows, kind='table'))
+        only_second = np.flatnonzero(~np.isin(np.arange(second_count), second_rows, kind='table'))
+
+        disagreeing = np.zeros(first_count, dtype=bool)
+        disagreements = {}
+        for rule in self.rules:
+            if rule.name in self.key_columns:
+                continue
+            left = self.comparable(rule, first[rule.name])[first_rows]
+            right = self.comparable(rule, second[rule.name])[second_rows]
+            if rule.kind == NUMBER:
+                differs = ~np.isclose(left, right, rtol=0.0, atol=self.tolerance, equal_nan=True)
+            else:
+                differs = left != right
+            disagreements[rule.name] = int(differs.sum())
+            disagreeing[first_rows[differs]] = True
+        disagreeing[only_first] = True
+        return DiffReport((first_rows, second_rows), only_first, only_second, disagreements, disagreeing)
+
+    def validate(self, rows: list[dict], second_run: list[dict] = None) -> ValidationReport:
+        """Check the rows of an extraction, and diff them with a second independent run if given"""
+        names = [rule.name for rule in self.rules]
+        columns = load_columns(rows, names)
+        errors = self.cell_errors(columns)
+        error_rows = np.zeros(len(rows), dtype=bool)
+        for invalid in errors.values():
+            error_rows |= invalid
+
+        diff = None
+        ambiguous_rows = np.zeros(len(rows), dtype=bool)
+        if second_run is not None:
+            diff = self.diff(columns, load_columns(second_run, names), len(rows), len(second_run))
+            ambiguous_rows = diff.disagreeing_rows
+
+        completeness = self.contract.completeness
+        return ValidationReport(len(rows), {name: int(invalid.sum()) for name, invalid in errors.items()}, error_rows,
+                                ambiguous_rows, completeness.error_acceptance, completeness.ambiguity_acceptance, diff)
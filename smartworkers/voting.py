@@ -0,0 +1,186 @@
+import hashlib
+import random
+import re
+from collections import deque
+
+
+WHITESPACE = re.compile(r"\s+")
+MERSENNE_PRIME = (1 << 61) - 1
+
+
+def normalize_response(text: str) -> str:
+    """Case and whitespace insensitive form of a response"""
+    return WHITESPACE.sub(" ", str(text)).strip().lower()
+
+
+def shingles(text: str, size: int = 3) -> set[int]:
+    """Hashed word n-grams of a normalized response"""
+    words = text.split(" ")
+    if len(words) <= size:
+        grams = [text]
+    else:
+        grams = (" ".join(words[index:index + size]) for index in range(len(words) - size + 1))
+    return {int.from_bytes(hashlib.blake2b(gram.encode(), digest_size=8).digest(), 'little') for gram in grams}
+
+
+class MinHasher:
+    """MinHash signatures, the share of equal positions estimates the Jaccard similarity"""
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 3, seed: int = 1):
+        generator = random.Random(seed)
+        self.shingle_size = shingle_size
+        self.permutations = [(generator.randrange(1, MERSENNE_PRIME), generator.randrange(0, MERSENNE_PRIME)) for _ in range(num_perm)]
+
+    def signature(self, normalized: str) -> tuple[int, ...]:
+        values = shingles(normalized, self.shingle_size)
+        return tuple(min((a * value + b) % MERSENNE_PRIME for value in values) for a, b in self.permutations)
+
+    @staticmethod
+    def similarity(first: tuple, second: tuple) -> float:
+        return sum(1 for x, y in zip(first, second) if x == y) / len(first)
+
+    def fingerprint(self, response) -> 'Fingerprint':
+        return Fingerprint(response, self)
+
+
+# The permutations only depend on the seed, histories and votes without a hasher of their own share these
+DEFAULT_HASHER = MinHasher()
+
+
+class Fingerprint:
+    """Normalized form and signature of one response, the signature is computed on first use only.
+
+    A response is looked up in the history, added to the vote and then to the history,
+    passing its fingerprint along hashes it once instead of at every stage.
+    """
+    __slots__ = ('normalized', '_hasher', '_signature')
+
+    def __init__(self, response, hasher: MinHasher):
+        self.normalized = normalize_response(response)
+        self._hasher = hasher
+        self._signature = None
+
+    @property
+    def signature(self) -> tuple[int, ...]:
+        if self._signature is None:
+            self._signature = self._hasher.signature(self.normalized)
+        return self._signature
+
+
+class ResponseHistory:
+    """Bounded index of past responses that also recognises near-duplicates.
+
+    Signatures are split into bands for locality sensitive hashing, so a lookup only
+    compares against responses sharing a band. The oldest responses are forgotten once
+    max_entries is reached.
+    """
+
+    def __init__(self, max_entries: int = 1000, threshold: float = 0.8, hasher: MinHasher = None, bands: int = 16):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.hasher = hasher or DEFAULT_HASHER
+        self.bands = bands
+        self.rows = len(self.hasher.permutations) // bands
+        self._entries = deque()
+        self._exact = {}
+        self._buckets = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _band_keys(self, signature: tuple) -> list:
+        return [(band, signature[band * self.rows:(band + 1) * self.rows]) for band in range(self.bands)]
+
+    def __contains__(self, response) -> bool:
+        return self.find(response) is not None
+
+    def fingerprint(self, response) -> Fingerprint:
+        return self.hasher.fingerprint(response)
+
+    def find(self, response, fingerprint: Fingerprint = None) -> str:
+        """Past response equal or similar to the given one, None if there is none"""
+        fingerprint = fingerprint or self.fingerprint(response)
+        if fingerprint.normalized in self._exact:
+            return self._exact[fingerprint.normalized][0]
+        signature = fingerprint.signature
+        for key in self._band_keys(signature):
+            for entry in self._buckets.get(key, ()):
+                if MinHasher.similarity(signature, entry[2]) >= self.threshold:
+                    return entry[0]
+        return None
+
+    def add(self, response, fingerprint: Fingerprint = None):
+        fingerprint = fingerprint or self.fingerprint(response)
+        normalized = fingerprint.normalized
+        if normalized in self._exact:
+            return
+        signature = fingerprint.signature
+        entry = (response, normalized, signature)
+        self._entries.append(entry)
+        self._exact[normalized] = entry
+        for key in self._band_keys(signature):
+            self._buckets.setdefault(key, []).append(entry)
+
+        while len(self._entries) > self.max_entries:
+            self._forget(self._entries.popleft())
+
+    def update(self, responses, fingerprints: list[Fingerprint] = None):
+        """Add responses, with their fingerprints when they are known already"""
+        for response, fingerprint in zip(responses, fingerprints or [None] * len(responses)):
+            self.add(response, fingerprint)
+
+    def _forget(self, entry: tuple):
+        del self._exact[entry[1]]
+        for key in self._band_keys(entry[2]):
+            bucket = self._buckets[key]
+            bucket.remove(entry)
+            if not bucket:
+                del self._buckets[key]
+
+
+class QuorumVote:
+    """Groups the expert responses of one step by similarity and tracks the leading group"""
+
+    def __init__(self, quorum: int, threshold: float = 0.8, hasher: MinHasher = None):
+        self.quorum = quorum
+        self.threshold = threshold
+        self.hasher = hasher or DEFAULT_HASHER
+        self.responses = []
+        self.feedbacks = []
+        self.fingerprints = []
+        self._groups = []  # [first response index, signature, normalized, votes]
+
+    def add(self, response: str, feedback: str, fingerprint: Fingerprint = None):
+        fingerprint = fingerprint or self.hasher.fingerprint(response)
+        self.responses.append(response)
+        self.feedbacks.append(feedback)
+        self.fingerprints.append(fingerprint)
+        for group in self._groups:
+            if group[2] == fingerprint.normalized:
+                group[3] += 1
+                return
+            if MinHasher.similarity(fingerprint.signature, group[1]) >= self.threshold:
+                group[3] += 1
+                return
+        self._groups.append([len(self.responses) - 1, fingerprint.signature, fingerprint.normalized, 1])
+
+    @property
+    def leading_votes(self) -> int:
+        return max((group[3] for group in self._groups), default=0)
+
+    @property
+    def reached(self) -> bool:
+        return self.leading_votes >= self.quorum
+
+    @property
+    def needed(self) -> int:
+        """Votes still missing before the leading group reaches the quorum"""
+        return max(self.quorum - self.leading_votes, 0)
+
+    @property
+    def winner(self) -> (str, str):
+        """Response and feedback of the first expert of the largest group, earlier groups win ties"""
+        if not self._groups:
+            return None, None
+        index = max(self._groups, key=lambda group: (group[3], -group[0]))[0]
+        return self.responses[index], self.feedbacks[index]
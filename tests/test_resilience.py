@@ -0,0 +1,150 @@
+"""Retries, hedged requests and the circuit breaker of ResilientBackend against the fault injecting stub server"""
+import itertools
+import time
+
+import pytest
+
+from smartworkers.backends import BackendError, OpenAIBackend
+from smartworkers.resilience import CircuitBreaker, CircuitOpenError, ResilientBackend, RetryPolicy
+from smartworkers.stub_server import StubLLMServer
+
+MESSAGES = [{"role": "user", "content": "Extract the obstacles."}]
+
+
+@pytest.fixture
+def stub_server():
+    """Starts StubLLMServer(["Obstacle list."], **kwargs) for the test, stopped after it"""
+    servers = []
+
+    def start(**kwargs) -> StubLLMServer:
+        servers.append(StubLLMServer(["Obstacle list."], **kwargs).start())
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def resilient(server: StubLLMServer, **kwargs) -> ResilientBackend:
+    return ResilientBackend(OpenAIBackend("sk-fake", api_base=server.url), **kwargs)
+
+
+def chat(backend: ResilientBackend) -> str:
+    return backend.chat(MESSAGES, "gpt-4", 0.1).content
+
+
+def every_third(index, payload):
+    # 503, a dropped connection and 429 in turn
+    return (503, "drop", 429)[index // 3 % 3] if index % 3 == 0 else None
+
+
+def test_transient_faults_are_retried_once(stub_server):
+    server = stub_server(faults=every_third)
+    backend = resilient(server, retry=RetryPolicy(base_delay=0.01))
+    answers = [chat(backend) for _ in range(30)]
+    backend.close()
+
+    assert answers == ["Obstacle list."] * 30
+    faults = sum(1 for index in range(len(server.requests)) if every_third(index, None) is not None)
+    assert backend.retries == faults > 0
+    assert len(server.requests) == 30 + faults
+
+
+def test_permanent_errors_are_not_retried(stub_server):
+    server = stub_server(faults=lambda index, payload: 400)
+    backend = resilient(server, retry=RetryPolicy(base_delay=0.01))
+    with pytest.raises(BackendError):
+        chat(backend)
+    backend.close()
+
+    assert backend.retries == 0
+    assert len(server.requests) == 1
+
+
+def test_retry_after_replaces_the_backoff(stub_server):
+    server = stub_server(faults=lambda index, payload: 429 if index % 2 == 0 else None, retry_after=0.05)
+    # The backoff of the policy alone would wait at least 10s per query
+    backend = resilient(server, retry=RetryPolicy(base_delay=10, max_delay=30))
+    start = time.perf_counter()
+    for _ in range(5):
+        chat(backend)
+    elapsed = time.perf_counter() - start
+    backend.close()
+
+    assert backend.retries == 5
+    assert 5 * 0.05 <= elapsed < 5 * 0.05 + 2
+
+
+SLOW = 0.3
+
+
+def every_tenth_slow():
+    requests = itertools.count()
+    return lambda: SLOW if next(requests) % 10 == 9 else 0.005
+
+
+@pytest.mark.parametrize("hedge_percentile", [None, 90])
+def test_hedged_requests_cut_the_slow_tail(stub_server, hedge_percentile):
+    server = stub_server(latency=every_tenth_slow())
+    backend = resilient(server, hedge_percentile=hedge_percentile)
+    # Hedging starts once enough latencies are known to estimate the percentile
+    for _ in range(backend.latencies.min_samples):
+        chat(backend)
+    slow = 0
+    for _ in range(30):
+        start = time.perf_counter()
+        assert chat(backend) == "Obstacle list."
+        slow += time.perf_counter() - start >= SLOW
+    backend.close()
+
+    if hedge_percentile is None:
+        assert backend.hedges == 0
+        assert slow > 0
+    else:
+        assert backend.hedges > 0
+        assert slow == 0
+
+
+def test_circuit_opens_and_fails_fast(stub_server):
+    server = stub_server(faults=lambda index, payload: 500)
+    backend = resilient(server, retry=RetryPolicy(max_attempts=2, base_delay=0.01),
+                        breaker=CircuitBreaker(failure_threshold=5, reset_timeout=60))
+    outcomes = []
+    for _ in range(20):
+        try:
+            chat(backend)
+        except CircuitOpenError:
+            outcomes.append("open")
+        except BackendError:
+            outcomes.append("failed")
+    backend.close()
+
+    assert backend.breaker.state == CircuitBreaker.OPEN
+    assert len(server.requests) == 5
+    assert outcomes.count("open") >= 20 - 5
+
+
+@pytest.mark.parametrize("trial_status, trial_error", [(None, None), (400, BackendError)])
+def test_half_open_trial_closes_the_circuit(stub_server, trial_status, trial_error):
+    fault = {"status": 500}
+    reset_timeout = 0.1
+    server = stub_server(faults=lambda index, payload: fault["status"])
+    backend = resilient(server, retry=RetryPolicy(max_attempts=1), breaker=CircuitBreaker(3, reset_timeout))
+    for _ in range(4):
+        with pytest.raises(BackendError):
+            chat(backend)
+    assert backend.breaker.state == CircuitBreaker.OPEN
+
+    # The trial after the reset timeout reaches the endpoint, which answers again
+    fault["status"] = trial_status
+    time.sleep(reset_timeout * 1.5)
+    if trial_error is None:
+        assert chat(backend) == "Obstacle list."
+    else:
+        with pytest.raises(trial_error):
+            chat(backend)
+    assert backend.breaker.state == CircuitBreaker.CLOSED
+
+    fault["status"] = None
+    assert [chat(backend) for _ in range(3)] == ["Obstacle list."] * 3
+    backend.close()